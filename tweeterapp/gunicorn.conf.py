@@ -0,0 +1,14 @@
+# gunicorn settings for the ASGI app:
+#   gunicorn tweeterapp.asgi:application -c gunicorn.conf.py
+# Each uvicorn worker runs an event loop, so slow clients and idle keep-alive
+# connections don't tie up a worker the way they do a sync one. The worker
+# count comes from WEB_CONCURRENCY and the port from PORT, as usual. For the
+# sync WSGI app instead: GUNICORN_WORKER_CLASS=sync and tweeterapp.wsgi:application.
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+# Only used by the sync worker class
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
@@ -0,0 +1,246 @@
+# A user's data as NDJSON, one record per line: an "account" header, then
+# their tweets, likes, comments and follows. Dumps read each table with a
+# server-side iterator, so memory stays flat however many rows there are;
+# loads insert in batches, one transaction each.
+#
+#   {"type": "account", "version": 1, "username": ..., "bio": ..., "date_joined": ...}
+#   {"type": "tweet", "id": ..., "text": ..., "image": ..., "created_at": ...}
+#   {"type": "like", "tweet": ..., "author": ..., "created_at": ...}
+#   {"type": "comment", "tweet": ..., "author": ..., "text": ..., "created_at": ...}
+#   {"type": "follow", "username": ...}
+#
+# Likes and comments name their tweet by its exported id and author. On the
+# user's own tweets that is the tweet loaded from the same file; otherwise the
+# tweet must already exist here, by that id and author. Images go by storage
+# name: a loaded tweet shares the file if it is stored here, and has none if
+# it isn't.
+import json
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import conditional, counters, graph, images, timeline
+from .models import Blob, Comment, Like, Profile, Tweet
+
+VERSION = 1
+CONTENT_TYPE = 'application/x-ndjson'
+
+Follow = Profile.follows.through
+
+
+def records(user, chunk_size=2000):
+    """The user's records, in file order."""
+    yield {
+        'type': 'account', 'version': VERSION, 'username': user.username,
+        'bio': Profile.objects.filter(user=user).values_list('bio', flat=True).first() or '',
+        'date_joined': user.date_joined,
+    }
+    tweets = Tweet.objects.filter(user=user).order_by('pk').values_list('pk', 'text', 'image', 'created_at')
+    for pk, text, image, created_at in tweets.iterator(chunk_size=chunk_size):
+        yield {'type': 'tweet', 'id': pk, 'text': text, 'image': image or None, 'created_at': created_at}
+    likes = Like.objects.filter(user=user).order_by('pk').values_list('tweet_id', 'tweet__user__username', 'created_at')
+    for tweet_id, author, created_at in likes.iterator(chunk_size=chunk_size):
+        yield {'type': 'like', 'tweet': tweet_id, 'author': author, 'created_at': created_at}
+    comments = (Comment.objects.filter(user=user).order_by('pk')
+                .values_list('tweet_id', 'tweet__user__username', 'text', 'created_at'))
+    for tweet_id, author, text, created_at in comments.iterator(chunk_size=chunk_size):
+        yield {'type': 'comment', 'tweet': tweet_id, 'author': author, 'text': text, 'created_at': created_at}
+    follows = Follow.objects.filter(from_profile__user=user).order_by('pk').values_list('to_profile__user__username', flat=True)
+    for username in follows.iterator(chunk_size=chunk_size):
+        yield {'type': 'follow', 'username': username}
+
+
+def _encode(value):
+    # Datetimes to the microsecond, unlike DjangoJSONEncoder's milliseconds
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def lines(user, chunk_size=2000):
+    """records() encoded, one NDJSON line each."""
+    for record in records(user, chunk_size):
+        yield json.dumps(record, default=_encode) + '\n'
+
+
+async def alines(user, chunk_size=2000):
+    """lines() for ASGI responses, read a chunk at a time on the sync thread."""
+    it = lines(user, chunk_size)
+    while chunk := await sync_to_async(list)(islice(it, chunk_size)):
+        for line in chunk:
+            yield line
+
+
+class _TweetIds:
+    # Exported tweet id -> id here, as two sorted arrays: 16 bytes a tweet
+    def __init__(self):
+        self.old = array('q')
+        self.new = array('q')
+
+    def add(self, old, new):
+        if self.old and old <= self.old[-1]:
+            raise ValueError(f"Tweet {old} is out of order; tweets must be in exported order.")
+        self.old.append(old)
+        self.new.append(new)
+
+    def get(self, old):
+        i = bisect_left(self.old, old)
+        return self.new[i] if i < len(self.old) and self.old[i] == old else None
+
+
+def _datetime(value):
+    return parse_datetime(value) if value else None
+
+
+class Loader:
+    """
+    Loads records into user's account (by default the exported username,
+    created if missing), batch_size rows per transaction.
+    """
+
+    def __init__(self, user=None, batch_size=1000):
+        self.user = user
+        self.batch_size = batch_size
+        self.exported_username = None
+        self.tweet_ids = _TweetIds()
+        self.followed = False
+
+    def load(self, lines):
+        """Load NDJSON lines, yielding (type, loaded, skipped) per batch."""
+        kind, batch = None, []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Line {number}: {e}") from None
+            if record.get('type') == 'account':
+                self.start(record)
+                continue
+            if self.exported_username is None:
+                raise ValueError(f"Line {number}: expected the account record first.")
+            if batch and (record.get('type') != kind or len(batch) >= self.batch_size):
+                yield self.flush(kind, batch)
+                batch = []
+            kind = record.get('type')
+            batch.append(record)
+        if batch:
+            yield self.flush(kind, batch)
+        if self.followed:
+            timeline.rebuild(self.user.profile)
+
+    def start(self, record):
+        if record.get('version') != VERSION:
+            raise ValueError(f"Unsupported archive version {record.get('version')!r}.")
+        self.exported_username = record['username']
+        if self.user is None:
+            self.user, created = User.objects.get_or_create(username=record['username'])
+            if created:
+                self.user.set_unusable_password()
+                self.user.save()
+                self.user.profile.bio = record.get('bio', '')
+                self.user.profile.save()
+
+    def flush(self, kind, batch):
+        load = getattr(self, f'load_{kind}s', None)
+        if load is None:
+            return kind, 0, len(batch)
+        with transaction.atomic():
+            loaded = load(batch)
+        return kind, loaded, len(batch) - loaded
+
+    def targets(self, batch):
+        """Ids here of the tweets batch's likes or comments are on."""
+        found = {}
+        others = {record['tweet'] for record in batch if record['author'] != self.exported_username}
+        for pk, author in Tweet.objects.filter(pk__in=others).values_list('pk', 'user__username'):
+            found[pk, author] = pk
+        for record in batch:
+            if record['author'] == self.exported_username:
+                found[record['tweet'], record['author']] = self.tweet_ids.get(record['tweet'])
+        return [found.get((record['tweet'], record['author'])) for record in batch]
+
+    def tweets_changed(self, tweet_ids):
+        counters.recount_tweets(Tweet.objects.filter(pk__in=tweet_ids))
+        for tweet_id in tweet_ids:
+            conditional.wrote(self.user.pk, tweet_id=tweet_id)
+
+    def claim_images(self, names):
+        """
+        Take a reference on each exported image that is stored here, as an
+        upload would, so deleting the original leaves the copy its file.
+        Images that aren't here come back as ''.
+        """
+        storage = Tweet._meta.get_field('image').storage
+        claimed = {}
+        for name, n in Counter(filter(None, names)).items():
+            if Blob.objects.filter(name=name).update(refcount=F('refcount') + n):
+                claimed[name] = name
+            elif storage.exists(name):
+                # From before the blob store: store it again, counted
+                with storage.open(name) as f:
+                    claimed[name] = stored = storage.save(name, f)
+                Blob.objects.filter(name=stored).update(refcount=F('refcount') + n - 1)
+        return [claimed.get(name, '') for name in names]
+
+    def load_tweets(self, batch):
+        names = self.claim_images([record.get('image') or '' for record in batch])
+        tweets = [
+            Tweet(user=self.user, text=record['text'], image=name,
+                  created_at=_datetime(record.get('created_at')))
+            for record, name in zip(batch, names)
+        ]
+        tweets = Tweet.objects.bulk_import(tweets, batch_size=self.batch_size)
+        for record, tweet in zip(batch, tweets):
+            self.tweet_ids.add(record['id'], tweet.pk)
+            # Renditions aren't exported; make the copy its own
+            if tweet.image:
+                images.schedule(tweet, 'image', 'tweet')
+        return len(tweets)
+
+    def load_likes(self, batch):
+        likes = [
+            Like(tweet_id=tweet_id, user=self.user, created_at=_datetime(record.get('created_at')) or timezone.now())
+            for record, tweet_id in zip(batch, self.targets(batch)) if tweet_id is not None
+        ]
+        Like.objects.bulk_create(likes, ignore_conflicts=True)
+        self.tweets_changed({like.tweet_id for like in likes})
+        return len(likes)
+
+    def load_comments(self, batch):
+        loaded = [
+            (Comment(tweet_id=tweet_id, user=self.user, text=record['text']), _datetime(record.get('created_at')))
+            for record, tweet_id in zip(batch, self.targets(batch)) if tweet_id is not None
+        ]
+        comments = Comment.objects.bulk_create([comment for comment, _ in loaded])
+        # auto_now_add stamped them with the current time
+        for comment, (_, created_at) in zip(comments, loaded):
+            comment.created_at = created_at or comment.created_at
+        Comment.objects.bulk_update(comments, ['created_at'])
+        self.tweets_changed({comment.tweet_id for comment in comments})
+        return len(comments)
+
+    def load_follows(self, batch):
+        profile_id = self.user.profile.pk
+        target_ids = set(Profile.objects.filter(
+            user__username__in=[record['username'] for record in batch]).values_list('pk', flat=True))
+        target_ids.discard(profile_id)
+        Follow.objects.bulk_create(
+            [Follow(from_profile_id=profile_id, to_profile_id=target_id) for target_id in target_ids],
+            ignore_conflicts=True)
+        counters.recount_profiles(Profile.objects.filter(pk__in=[profile_id, *target_ids]))
+        for target_id in target_ids:
+            graph.edge_changed(profile_id, target_id)
+        conditional.wrote(profile_ids=[profile_id, *target_ids], scope=None)
+        self.followed = True
+        return len(target_ids)
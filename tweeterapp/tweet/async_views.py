@@ -0,0 +1,86 @@
+# Async variants of the hot read paths and the like/follow JSON endpoints,
+# routed instead of their tweet.views twins when ASYNC_VIEWS is on (the ASGI
+# app turns it on). Reads go through the async ORM. Template rendering and the
+# sync-only pieces (full-text search, trending, suggestions, the write paths
+# and the jobs they queue) run on Django's sync thread via sync_to_async.
+# Queries and contexts are built by tweet.pages, as for the sync views.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
+from django.shortcuts import aget_object_or_404, render
+from django.views.decorators.http import require_http_methods
+
+from . import archive, cards, conditional, linkify, pages
+from .models import Profile, Tweet
+
+arender = sync_to_async(render)
+
+
+async def get_user(request):
+    # request.user is a separate lazy lookup from auser(); share one load so
+    # the template render doesn't fetch the user again
+    request.user = user = await request.auser()
+    return user
+
+
+async def feed_context(user, page_obj, extra_texts=()):
+    return pages.cards_context(page_obj, await cards.aliked_ids(user, page_obj),
+                               await linkify.aexisting_mentions(pages.card_texts(page_obj, extra_texts)))
+
+
+@conditional.condition(conditional.feed_markers, expires=settings.TRENDING_CACHE_TIMEOUT,
+                       anonymous_max_age=settings.ANONYMOUS_FEED_MAX_AGE)
+async def tweet_list(request):
+    user = await get_user(request)
+    paginator = await sync_to_async(pages.feed_paginator)(request.GET)
+    page_obj = await paginator.aget_page(request.GET.get('cursor'))
+    return await arender(request, 'tweet_list.html', {
+        **await feed_context(user, page_obj),
+        **await sync_to_async(pages.feed_sidebar)(user, request.GET),
+    })
+
+
+@conditional.condition(conditional.profile_markers)
+async def profile(request, username):
+    user = await get_user(request)
+    profile_user = await aget_object_or_404(User.objects.select_related('profile'), username=username)
+    tab = request.GET.get('tab', 'tweets')
+    page_obj = await pages.profile_paginator(profile_user, tab).aget_page(request.GET.get('cursor'))
+    return await arender(request, 'profile.html', {
+        **await feed_context(user, page_obj, [profile_user.profile.bio]),
+        **await sync_to_async(pages.profile_relationship)(user, profile_user),
+        'profile_user': profile_user,
+        'active_tab': tab,
+    })
+
+
+@conditional.condition(conditional.tweet_markers)
+async def tweet_detail(request, pk):
+    user = await get_user(request)
+    tweet = await aget_object_or_404(Tweet.objects.for_display(), pk=pk)
+    comments = [comment async for comment in tweet.comments.select_related('user__profile').order_by('-created_at')]
+    return await arender(request, 'tweet_detail.html', pages.detail_context(
+        tweet, comments, await cards.aliked_ids(user, [tweet]), await linkify.aexisting_mentions([tweet.text])))
+
+
+@login_required
+@require_http_methods(['GET', 'POST', 'PUT', 'DELETE'])
+async def follow_toggle(request, pk):
+    user = await get_user(request)
+    profile_to_toggle = await aget_object_or_404(Profile.objects.select_related('user'), pk=pk)
+    return await sync_to_async(pages.toggle_follow)(request, user, profile_to_toggle)
+
+
+@login_required
+@require_http_methods(['GET', 'POST', 'PUT', 'DELETE'])
+async def tweet_like(request, pk):
+    user = await get_user(request)
+    tweet = await aget_object_or_404(Tweet.objects.only('id', 'user_id'), pk=pk)
+    return await sync_to_async(pages.toggle_like)(request, user, tweet)
+
+
+@login_required
+async def export_data(request):
+    # A sync iterator would be read whole before the first byte went out
+    return pages.export_response(await get_user(request), archive.alines)
@@ -0,0 +1,19 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.backends import ModelBackend
+
+from . import memo
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose get_user, which runs on every authenticated request,
+    reads the memoized user and profile instead of querying for them.
+    """
+
+    def get_user(self, user_id):
+        user = memo.user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        # ModelBackend's own goes straight to the async ORM
+        return await sync_to_async(self.get_user)(user_id)
@@ -0,0 +1,102 @@
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import linkify, perf
+from .models import Like
+
+TEMPLATES = {
+    'feed': 'tweet_card.html',
+    'profile': 'profile_tweet_card.html',
+}
+
+# Viewer-specific spots in a cached card. HTML comments can't come out of
+# escaped tweet text, so the markers are safe to find and replace later.
+HOLES = {name: mark_safe(f'<!--card:{name}-->') for name in ('like_state', 'heart', 'owner', 'end_owner')}
+OWNER_RE = re.compile(re.escape(HOLES['owner']) + '.*?' + re.escape(HOLES['end_owner']), re.S)
+LIKED = {'like_state': 'text-red-500', 'heart': 'fill-current text-red-500'}
+NOT_LIKED = {'like_state': 'text-gray-400 hover:text-red-500', 'heart': 'fill-none'}
+
+
+def card_key(tweet, variant, mentioned_users):
+    """
+    Cache key for one rendered card. It changes whenever anything drawn on the
+    card does, so edits, counter bumps and profile saves never serve stale HTML.
+    """
+    profile = tweet.user.profile
+    linked = sorted(linkify.mentions(tweet.text) & mentioned_users)
+    version = repr((
+        tweet.updated_at.timestamp(), tweet.likes_count, tweet.comments_count,
+        profile.updated_at.timestamp(), linked,
+    ))
+    return f'tweet-card:{variant}:{tweet.pk}:{hashlib.md5(version.encode()).hexdigest()}'
+
+
+def liked_ids(user, tweets):
+    """Ids of the tweets in tweets that user likes, in one query."""
+    if not user.is_authenticated:
+        return set()
+    return set(Like.objects.filter(user=user, tweet__in=[tweet.pk for tweet in tweets]).values_list('tweet_id', flat=True))
+
+
+async def aliked_ids(user, tweets):
+    """liked_ids for async views."""
+    if not user.is_authenticated:
+        return set()
+    likes = Like.objects.filter(user=user, tweet__in=[tweet.pk for tweet in tweets]).values_list('tweet_id', flat=True)
+    return {tweet_id async for tweet_id in likes}
+
+
+def fill(card, liked, owner):
+    for name, value in (LIKED if liked else NOT_LIKED).items():
+        card = card.replace(HOLES[name], value)
+    if owner:
+        return card.replace(HOLES['owner'], '').replace(HOLES['end_owner'], '')
+    return OWNER_RE.sub('', card)
+
+
+def render_cards(tweets, variant, user, liked=None, mentioned_users=None):
+    """
+    HTML for a page of tweet cards. Shared markup comes from the cache in one
+    round trip and only missing cards are rendered; the like state and the
+    author's edit/delete links are filled in for this viewer afterwards.
+    """
+    tweets = list(tweets)
+    if liked is None:
+        liked = liked_ids(user, tweets)
+    if mentioned_users is None:
+        mentioned_users = linkify.existing_mentions(tweet.text for tweet in tweets)
+    keys = [card_key(tweet, variant, mentioned_users) for tweet in tweets]
+    cached = cache.get_many(keys)
+    perf.record_cache(hits=len(cached), misses=len(keys) - len(cached))
+
+    missing = {}
+    html = []
+    for tweet, key in zip(tweets, keys):
+        card = cached.get(key)
+        if card is None:
+            card = missing[key] = render_to_string(TEMPLATES[variant], {
+                'tweet': tweet,
+                'holes': HOLES,
+                'mentioned_users': mentioned_users,
+            })
+        html.append(fill(card, tweet.pk in liked, tweet.user_id == user.pk))
+    if missing:
+        cache.set_many(missing, settings.TWEET_CARD_CACHE_TIMEOUT)
+    return mark_safe(''.join(html))
+
+
+def forget(tweet):
+    """Drop a tweet's cards for its current version, e.g. once it is deleted."""
+    try:
+        tweet.user.profile
+    except ObjectDoesNotExist:
+        # The author is being deleted too; their cards can't be reached again
+        return
+    mentioned_users = linkify.existing_mentions([tweet.text])
+    cache.delete_many([card_key(tweet, variant, mentioned_users) for variant in TEMPLATES])
@@ -0,0 +1,152 @@
+# Conditional GET for the feed, profile and tweet pages. A page's ETag and
+# Last-Modified come from the "last write" markers it shows -- versions in the
+# shared cache (see tweet.memo) that the write paths bump through wrote() -- so
+# an unchanged page is answered 304 before any of its queries run:
+#
+#   ('writes', EVERYONE)  any tweet, like or comment
+#   ('writes', PEOPLE)    any user or profile edit; every page shows names and avatars
+#   ('writes', user_id)   the user's tweets, likes, comments, follows,
+#                         notifications and suggestions, and writes to their tweets
+#   ('tweet', tweet_id)   the tweet, its likes and comments
+#
+# Like the memos, markers need a cache every process sees (CACHE_SHARED);
+# without one pages are always rendered.
+import hashlib
+import time
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.models import User
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import memo, routers
+
+EVERYONE = 'all'
+PEOPLE = 'people'
+
+
+def wrote(*user_ids, tweet_id=None, author_id=None, profile_ids=(), scope=EVERYONE):
+    """
+    Record a write to scope's marker (EVERYONE, PEOPLE or None), to each of
+    user_ids' and the profile_ids' owners' pages, and to tweet_id and its
+    author's pages (looked up unless author_id is given).
+    """
+    if not settings.CACHE_SHARED:
+        return
+    from .models import Profile, Tweet
+
+    user_ids = set(user_ids)
+    if profile_ids:
+        user_ids.update(Profile.objects.filter(pk__in=profile_ids).values_list('user_id', flat=True))
+    if tweet_id is not None:
+        if author_id is None:
+            author_id = Tweet.objects.filter(pk=tweet_id).values_list('user_id', flat=True).first()
+        user_ids.add(author_id)
+        memo.bump('tweet', tweet_id)
+    if scope is not None:
+        memo.bump('writes', scope)
+    for user_id in user_ids - {None}:
+        memo.bump('writes', user_id)
+
+
+def user_id(username):
+    """username's id, or None, memoized until someone is saved under that name."""
+    return memo.memoize(
+        'user-id', username, lambda: User.objects.filter(username=username).values_list('id', flat=True).first())
+
+
+# Markers for the views with an ETag
+
+def feed_markers(request):
+    return [('writes', EVERYONE)]
+
+
+def profile_markers(request, username):
+    author_id = user_id(username)
+    if author_id is None:
+        return None
+    if request.GET.get('tab') == 'likes':
+        # Other people's tweets
+        return [('writes', author_id), ('writes', EVERYONE)]
+    return [('writes', author_id)]
+
+
+def tweet_markers(request, pk):
+    return [('tweet', pk)]
+
+
+def _validators(request, view, markers, expires, args, kwargs):
+    if not settings.CACHE_SHARED or request.method not in ('GET', 'HEAD'):
+        return None, None
+    # A flash message shows once, on a freshly rendered page
+    if len(messages.get_messages(request)):
+        return None, None
+    wanted = markers(request, *args, **kwargs)
+    if wanted is None:
+        return None, None
+    wanted = [('writes', PEOPLE), *wanted]
+    user = request.user
+    if user.is_authenticated:
+        wanted.append(('writes', user.pk))
+    stamps = memo.versions(*wanted)
+    if routers.in_use() and time.time_ns() - max(stamps) < settings.DATABASE_REPLICA_PIN_SECONDS * 10**9:
+        # Rendered from a replica, the page may predate the write: an ETag
+        # would let clients keep that copy after the replicas catch up
+        return None, None
+    state = [view.__name__, request.get_full_path(), user.pk, stamps]
+    if expires:
+        # Pages that also change with time, like the trending box
+        state.append(int(time.time() // expires))
+    return f'"{hashlib.md5(repr(state).encode()).hexdigest()}"', max(stamps) // 10**9
+
+
+def _finish(request, response, etag, last_modified, anonymous_max_age):
+    if etag and response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+    if response.status_code not in (200, 304):
+        return response
+    if request.user.is_authenticated:
+        if etag:
+            # Without this, browsers may reuse a page for a while unchecked
+            patch_cache_control(response, private=True, no_cache=True)
+    elif anonymous_max_age and not response.cookies:
+        # A shared cache may keep the anonymous page, unless it sets a cookie
+        # (a CSRF token, a consumed message) meant for one visitor
+        patch_cache_control(response, public=True, max_age=anonymous_max_age)
+    elif etag:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def condition(markers, expires=None, anonymous_max_age=None):
+    """
+    Answer a GET with 304 Not Modified when the client's copy is current.
+    markers(request, *args, **kwargs) returns the markers the page shows
+    beyond PEOPLE and the viewer's own, or None to always render it. Pages
+    that also change with time every `expires` seconds say so; with
+    anonymous_max_age, anonymous responses are public for that long.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def inner(request, *args, **kwargs):
+                etag, last_modified = await sync_to_async(_validators)(request, view, markers, expires, args, kwargs)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified) if etag else None
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return await sync_to_async(_finish)(request, response, etag, last_modified, anonymous_max_age)
+        else:
+            @wraps(view)
+            def inner(request, *args, **kwargs):
+                etag, last_modified = _validators(request, view, markers, expires, args, kwargs)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified) if etag else None
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return _finish(request, response, etag, last_modified, anonymous_max_age)
+        return inner
+    return decorator
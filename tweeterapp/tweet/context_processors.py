@@ -0,0 +1,10 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import notifications
+
+
+def unread_notifications(request):
+    # Lazy so pages that never show the badge never run the COUNT
+    if not request.user.is_authenticated:
+        return {}
+    return {'unread_notifications_count': SimpleLazyObject(lambda: notifications.unread_count(request.user))}
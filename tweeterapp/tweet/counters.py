@@ -0,0 +1,30 @@
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Profile, Tweet
+
+
+def _count(queryset, field):
+    # Correlated COUNT(*) subquery usable inside a bulk UPDATE
+    counted = queryset.order_by().values(field).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(counted), 0)
+
+
+def recount_tweets(queryset=None):
+    """Recompute likes_count/comments_count for the given tweets in one UPDATE."""
+    queryset = Tweet.objects.all() if queryset is None else queryset
+    return queryset.update(
+        likes_count=_count(Tweet.likes.through.objects.filter(tweet_id=OuterRef('pk')), 'tweet_id'),
+        comments_count=_count(Comment.objects.filter(tweet_id=OuterRef('pk')), 'tweet_id'),
+    )
+
+
+def recount_profiles(queryset=None):
+    """Recompute follower/following/tweet counters for the given profiles in one UPDATE."""
+    queryset = Profile.objects.all() if queryset is None else queryset
+    follows = Profile.follows.through.objects
+    return queryset.update(
+        followers_count=_count(follows.filter(to_profile_id=OuterRef('pk')), 'to_profile_id'),
+        following_count=_count(follows.filter(from_profile_id=OuterRef('pk')), 'from_profile_id'),
+        tweets_count=_count(Tweet.objects.filter(user_id=OuterRef('user_id')), 'user_id'),
+    )
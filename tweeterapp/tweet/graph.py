@@ -0,0 +1,81 @@
+# The follow graph as sorted arrays of profile ids: whom each profile follows
+# and who follows it. Each side is loaded with one query on first use and
+# memoized (see tweet.memo) until one of its edges changes, so a membership
+# test is a binary search over a compact C array and an overlap between two
+# profiles is an intersection of two arrays, with no query once cached.
+from array import array
+from bisect import bisect_left
+
+from . import memo
+from .models import Profile
+
+Follow = Profile.follows.through
+
+# Profile ids are 64-bit BigAutoField values
+TYPECODE = 'q'
+
+
+def _ids(column, **edges):
+    return array(TYPECODE, Follow.objects.filter(**edges).order_by(column).values_list(column, flat=True))
+
+
+def following(profile_id):
+    """Sorted ids of the profiles profile_id follows."""
+    return memo.memoize('following', profile_id, lambda: _ids('to_profile_id', from_profile_id=profile_id))
+
+
+def followers(profile_id):
+    """Sorted ids of the profiles following profile_id."""
+    return memo.memoize('followers', profile_id, lambda: _ids('from_profile_id', to_profile_id=profile_id))
+
+
+def contains(ids, profile_id):
+    i = bisect_left(ids, profile_id)
+    return i < len(ids) and ids[i] == profile_id
+
+
+def intersection(a, b):
+    """Sorted ids in both of two sorted arrays."""
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) * 8 < len(b):
+        # Far smaller: look each of its ids up in the other
+        return array(TYPECODE, [pk for pk in a if contains(b, pk)])
+    return array(TYPECODE, sorted(set(a).intersection(b)))
+
+
+def is_following(profile_id, target_id):
+    return contains(following(profile_id), target_id)
+
+
+def mutuals(profile_id):
+    """Profiles profile_id follows that follow it back."""
+    return intersection(following(profile_id), followers(profile_id))
+
+
+def followed_by_following(profile_id, target_id):
+    """Of the profiles profile_id follows, the ones following target_id."""
+    return intersection(following(profile_id), followers(target_id))
+
+
+def relationship(profile_id, target_id, limit=3):
+    """
+    For profile_id looking at target_id: whether it follows target_id, up to
+    limit of the profiles it follows that do (users loaded), and how many of
+    those there are in all.
+    """
+    follows = following(profile_id)
+    known = intersection(follows, followers(target_id))
+    sample = list(Profile.objects.filter(pk__in=known[:limit]).select_related('user').order_by('pk')) if known else []
+    return contains(follows, target_id), sample, len(known)
+
+
+def counts(profile_id):
+    """(followers, following) of profile_id."""
+    return len(followers(profile_id)), len(following(profile_id))
+
+
+def edge_changed(profile_id, target_id):
+    """Retire both ends of the edge from profile_id to target_id."""
+    memo.bump('following', profile_id)
+    memo.bump('followers', target_id)
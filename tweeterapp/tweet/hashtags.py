@@ -0,0 +1,71 @@
+import re
+
+from django.utils.text import slugify
+
+from . import trending
+from .models import Tag, Tweet
+
+HASHTAG_RE = re.compile(r'#(\w+)')
+MAX_TAG_LENGTH = Tag._meta.get_field('slug').max_length
+
+
+def extract_hashtags(text):
+    """Map slug -> display name for each distinct hashtag in text."""
+    tags = {}
+    for name in HASHTAG_RE.findall(text):
+        name = name[:MAX_TAG_LENGTH]
+        slug = slugify(name)
+        if slug:
+            tags.setdefault(slug, name)
+    return tags
+
+
+def sync_tags(tweets, created=False):
+    """
+    Make each tweet's tags match the hashtags in its text. Works on any number
+    of saved tweets with a fixed number of queries: one insert for unseen
+    tags, one IN lookup, one read of the current links and one bulk insert
+    and delete for the difference. Returns the (tweet_id, tag_id) pairs added.
+    Pass created=True for freshly inserted tweets to skip reading old links.
+    """
+    wanted = {tweet.pk: extract_hashtags(tweet.text) for tweet in tweets}
+    names = {}
+    for tags in wanted.values():
+        for slug, name in tags.items():
+            names.setdefault(slug, name)
+
+    tag_ids = {}
+    if names:
+        Tag.objects.bulk_create(
+            [Tag(name=name, slug=slug) for slug, name in names.items()],
+            ignore_conflicts=True,
+        )
+        tag_ids = dict(Tag.objects.filter(slug__in=names).values_list('slug', 'id'))
+
+    desired = {
+        (tweet_id, tag_ids[slug])
+        for tweet_id, tags in wanted.items()
+        for slug in tags
+        if slug in tag_ids
+    }
+    Through = Tweet.tags.through
+    current = {}
+    if not created:
+        current = {
+            (tweet_id, tag_id): pk
+            for pk, tweet_id, tag_id in Through.objects.filter(tweet_id__in=wanted).values_list('id', 'tweet_id', 'tag_id')
+        }
+
+    created_at = {tweet.pk: tweet.created_at for tweet in tweets}
+    added = desired - current.keys()
+    if added:
+        Through.objects.bulk_create(
+            [Through(tweet_id=tweet_id, tag_id=tag_id) for tweet_id, tag_id in added],
+            ignore_conflicts=True,
+        )
+        trending.record((tag_id, created_at[tweet_id]) for tweet_id, tag_id in added)
+    stale = {pair: pk for pair, pk in current.items() if pair not in desired}
+    if stale:
+        Through.objects.filter(pk__in=stale.values()).delete()
+        trending.retract((tag_id, created_at[tweet_id]) for tweet_id, tag_id in stale)
+    return added
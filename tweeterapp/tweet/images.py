@@ -0,0 +1,146 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+# Pillow format name and file extension for each rendition format
+FORMATS = {
+    'avif': ('AVIF', 'avif'),
+    'webp': ('WEBP', 'webp'),
+}
+# Originals are re-encoded in their own format, minus metadata. GIFs are
+# left alone so animations survive.
+ORIGINAL_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+
+
+def supported_formats():
+    """The configured rendition formats this Pillow build can write."""
+    return [fmt for fmt in settings.IMAGE_RENDITION_FORMATS if features.check(fmt)]
+
+
+def _open(field_file):
+    field_file.open('rb')
+    try:
+        image = Image.open(field_file)
+        image.load()
+    finally:
+        field_file.close()
+    # Bake the EXIF rotation into the pixels before the EXIF is dropped
+    return ImageOps.exif_transpose(image), image.format
+
+
+def _encode(image, fmt, **options):
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    # Nothing from image.info is passed on, so EXIF, XMP and ICC are dropped
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def render(field_file, widths):
+    """
+    Build a metadata-free copy of the original and its renditions.
+    Returns (original bytes or None, {fmt: {width: bytes}}). The original is
+    None when its format isn't one we re-encode. Widths above the source
+    width are skipped; the smallest requested width is always produced.
+    """
+    image, source_format = _open(field_file)
+    original = None
+    if source_format in ORIGINAL_FORMATS:
+        original = _encode(image, source_format, quality=settings.IMAGE_ORIGINAL_QUALITY)
+
+    targets = sorted(w for w in widths if w <= image.width) or [min(widths)]
+    renditions = {}
+    for fmt in supported_formats():
+        pillow_format, _ = FORMATS[fmt]
+        renditions[fmt] = {}
+        for width in targets:
+            height = max(round(image.height * width / image.width), 1)
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+            renditions[fmt][width] = _encode(resized, pillow_format, quality=settings.IMAGE_RENDITION_QUALITY)
+    return original, renditions
+
+
+def process(instance, field_name, kind):
+    """
+    Strip the metadata from instance's uploaded image, store its renditions
+    next to it and record them in the <field>_renditions JSON field.
+    """
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        return
+    storage = field_file.storage
+    previous = getattr(instance, f'{field_name}_renditions') or {}
+    original, renditions = render(field_file, settings.IMAGE_RENDITION_WIDTHS[kind])
+
+    uploaded = name = field_file.name
+    saved = []
+    if original is not None:
+        name = storage.save(name, ContentFile(original))
+        saved.append(name)
+    stem = os.path.splitext(name)[0]
+    stored = {'source': name}
+    for fmt, by_width in renditions.items():
+        extension = FORMATS[fmt][1]
+        stored[fmt] = {}
+        for width, data in by_width.items():
+            stored[fmt][str(width)] = storage.save(f'{stem}_{width}w.{extension}', ContentFile(data))
+            saved.append(stored[fmt][str(width)])
+
+    # update() so the save signals don't queue the same work again; bump
+    # updated_at so cached tweet cards pick up the srcset. Matching on the
+    # uploaded name loses the race to a newer upload instead of clobbering it.
+    updated = type(instance).objects.filter(pk=instance.pk, **{field_name: uploaded}).update(**{
+        field_name: name,
+        f'{field_name}_renditions': stored,
+        'updated_at': timezone.now(),
+    })
+    if updated:
+        # The unstripped upload and the renditions of the image this one
+        # replaced. Every save() above took a reference, even when the stripped
+        # copy came out byte for byte the same as the upload.
+        garbage = [uploaded] if original is not None else []
+        garbage += _rendition_names(previous)
+    else:
+        garbage = saved
+    for old_name in garbage:
+        storage.delete(old_name)
+
+
+def _rendition_names(renditions):
+    return [name for fmt in FORMATS for name in renditions.get(fmt, {}).values()]
+
+
+def release(instance, field_name, name, renditions=None):
+    """
+    Drop the references instance held on an image it no longer uses, once
+    the transaction commits: the file called name and any renditions.
+    """
+    storage = getattr(instance, field_name).storage
+    names = ([name] if name else []) + _rendition_names(renditions or {})
+
+    def delete():
+        for old_name in names:
+            storage.delete(old_name)
+
+    if names:
+        transaction.on_commit(delete)
+
+
+def schedule(instance, field_name, kind):
+    """Queue instance's image for processing on a background worker."""
+    from .tasks import process_image
+    process_image.enqueue(instance._meta.label, instance.pk, field_name, kind)
+
+
+def needs_processing(instance, field_name):
+    field_file = getattr(instance, field_name)
+    renditions = getattr(instance, f'{field_name}_renditions') or {}
+    return bool(field_file) and renditions.get('source') != field_file.name
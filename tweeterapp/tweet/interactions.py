@@ -0,0 +1,69 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import conditional, graph, live
+from .models import Like, Profile, Tweet
+
+Follow = Profile.follows.through
+
+
+def _insert(model, **fields):
+    # One INSERT; the unique constraint decides whether the row was new, so
+    # two racing requests can't both count it
+    try:
+        with transaction.atomic():
+            model.objects.create(**fields)
+    except IntegrityError:
+        return False
+    return True
+
+
+def like(user_id, tweet_id):
+    """Make user_id like tweet_id. Returns (changed, likes_count)."""
+    with transaction.atomic():
+        changed = _insert(Like, tweet_id=tweet_id, user_id=user_id)
+        if changed:
+            Tweet.objects.filter(pk=tweet_id).update(likes_count=F('likes_count') + 1)
+        return _likes_changed(tweet_id, user_id, changed)
+
+
+def unlike(user_id, tweet_id):
+    """Remove user_id's like of tweet_id if there is one. Returns (changed, likes_count)."""
+    with transaction.atomic():
+        changed = Like.objects.filter(tweet_id=tweet_id, user_id=user_id).delete()[0] > 0
+        if changed:
+            Tweet.objects.filter(pk=tweet_id, likes_count__gt=0).update(likes_count=F('likes_count') - 1)
+        return _likes_changed(tweet_id, user_id, changed)
+
+
+def _likes_changed(tweet_id, user_id, changed):
+    count, author_id = Tweet.objects.filter(pk=tweet_id).values_list('likes_count', 'user_id').first() or (0, None)
+    if changed:
+        # Open pages showing the tweet update their count
+        live.publish('like', {'id': tweet_id, 'count': count})
+        conditional.wrote(user_id, tweet_id=tweet_id, author_id=author_id)
+    return changed, count
+
+
+def follow(profile_id, target_id):
+    """Make profile_id follow target_id. Returns whether the edge is new."""
+    with transaction.atomic():
+        changed = _insert(Follow, from_profile_id=profile_id, to_profile_id=target_id)
+        if changed:
+            Profile.objects.filter(pk=target_id).update(followers_count=F('followers_count') + 1)
+            Profile.objects.filter(pk=profile_id).update(following_count=F('following_count') + 1)
+            graph.edge_changed(profile_id, target_id)
+            conditional.wrote(profile_ids=[profile_id, target_id], scope=None)
+        return changed
+
+
+def unfollow(profile_id, target_id):
+    """Drop the follow edge if there is one. Returns whether it existed."""
+    with transaction.atomic():
+        changed = Follow.objects.filter(from_profile_id=profile_id, to_profile_id=target_id).delete()[0] > 0
+        if changed:
+            Profile.objects.filter(pk=target_id, followers_count__gt=0).update(followers_count=F('followers_count') - 1)
+            Profile.objects.filter(pk=profile_id, following_count__gt=0).update(following_count=F('following_count') - 1)
+            graph.edge_changed(profile_id, target_id)
+            conditional.wrote(profile_ids=[profile_id, target_id], scope=None)
+        return changed
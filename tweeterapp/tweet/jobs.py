@@ -0,0 +1,152 @@
+# A small database-backed job queue for the side effects of writes.
+# enqueue() inserts a Job row in the caller's transaction, so a job becomes
+# visible to workers exactly when the write that queued it commits. Workers
+# (`manage.py run_workers`) claim batches with SELECT ... FOR UPDATE SKIP
+# LOCKED where the database has it; on SQLite, which runs one writer at a
+# time, a single UPDATE over a subquery claims just as atomically.
+import json
+import logging
+import random
+import time
+import traceback
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import perf
+from .models import Job
+
+logger = logging.getLogger('tweet.jobs')
+
+
+def task(func):
+    """Register func as a job; queue calls to it with func.enqueue(*args)."""
+    func.job_name = f'{func.__module__}.{func.__qualname__}'
+    func.enqueue = partial(enqueue, func)
+    return func
+
+
+def enqueue(func, *args, delay=0):
+    """
+    Queue func(*args) to run on a worker, or run it right away with
+    JOBS_ALWAYS_EAGER. Arguments must survive a JSON round trip.
+    """
+    payload = json.loads(json.dumps(args))
+    if settings.JOBS_ALWAYS_EAGER:
+        func(*payload)
+        return None
+    return Job.objects.create(
+        name=func.job_name,
+        args=payload,
+        max_attempts=settings.JOBS_MAX_ATTEMPTS,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def claim(worker, limit):
+    """Lock up to limit runnable jobs for worker and return them."""
+    now = timezone.now()
+    runnable = Q(status=Job.QUEUED, run_after__lte=now) | Q(
+        # Its worker died mid-job; take it over
+        status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=settings.JOBS_LEASE_TIMEOUT),
+    )
+    candidates = Job.objects.filter(runnable).order_by('run_after', 'id')
+    claimed = {'status': Job.RUNNING, 'locked_by': worker, 'locked_at': now, 'attempts': F('attempts') + 1}
+    with transaction.atomic():
+        if connections[Job.objects.db].features.has_select_for_update_skip_locked:
+            ids = list(candidates.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(pk__in=ids).update(**claimed)
+        else:
+            Job.objects.filter(pk__in=candidates.values('id')[:limit]).update(**claimed)
+        return list(Job.objects.filter(status=Job.RUNNING, locked_by=worker, locked_at=now).order_by('run_after', 'id'))
+
+
+def renew(worker, jobs):
+    """Restart worker's lease on claimed jobs it hasn't run yet."""
+    if jobs:
+        Job.objects.filter(pk__in=[job.pk for job in jobs], status=Job.RUNNING, locked_by=worker).update(
+            locked_at=timezone.now())
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that has failed attempts times."""
+    delay = min(settings.JOBS_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOBS_RETRY_BACKOFF_MAX)
+    # Jitter so a burst of failures doesn't come back as a burst
+    return delay * random.uniform(1, 1.5)
+
+
+def run(job):
+    """
+    Run one claimed job; delete it on success, otherwise retry it later or
+    give up. Returns 'lost', without running it, if its lease ran out and
+    another worker took it over.
+    """
+    mine = Job.objects.filter(pk=job.pk, locked_by=job.locked_by)
+    if not mine.filter(status=Job.RUNNING).update(locked_at=timezone.now()):
+        return 'lost'
+    waited = (timezone.now() - job.run_after).total_seconds()
+    started = time.perf_counter()
+    try:
+        func = import_string(job.name)
+        with transaction.atomic():
+            func(*job.args)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            outcome = 'retried'
+            delay = backoff(job.attempts)
+            logger.warning("Job %s failed (attempt %d of %d), retrying in %.0fs", job, job.attempts, job.max_attempts, delay)
+            mine.update(
+                status=Job.QUEUED, locked_by='', locked_at=None, last_error=error,
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+        else:
+            outcome = 'failed'
+            logger.error("Job %s failed after %d attempts:\n%s", job, job.attempts, error)
+            mine.update(status=Job.FAILED, locked_at=None, last_error=error)
+    else:
+        outcome = 'succeeded'
+        mine.delete()
+
+    perf.registry.observe('job_duration_seconds', job.name, time.perf_counter() - started)
+    perf.registry.observe('job_wait_seconds', job.name, max(waited, 0))
+    perf.registry.inc(f'jobs_{outcome}_total', job.name)
+    perf.registry.flush()
+    return outcome
+
+
+def work(worker, stop, batch_size=None, burst=False):
+    """
+    Claim and run jobs as worker until stop is set or, with burst, until
+    nothing is runnable. Returns the number of jobs run.
+    """
+    done = 0
+    while not stop.is_set():
+        jobs = claim(worker, batch_size or settings.JOBS_BATCH_SIZE)
+        if not jobs:
+            if burst:
+                break
+            stop.wait(settings.JOBS_POLL_INTERVAL)
+            continue
+        for i, job in enumerate(jobs):
+            if run(job) != 'lost':
+                done += 1
+            # The batch was claimed under one lease; keep the jobs still
+            # waiting from looking lost while the ones ahead of them run
+            renew(worker, jobs[i + 1:])
+    return done
+
+
+def render_prometheus():
+    """Queue depth by status, as a gauge for the /metrics endpoint."""
+    prefix = settings.PERF_METRICS_PREFIX
+    depths = dict(Job.objects.values_list('status').annotate(n=Count('id')).order_by())
+    lines = [f'# HELP {prefix}_jobs Jobs in the queue.', f'# TYPE {prefix}_jobs gauge']
+    for status, _ in Job.STATUSES:
+        lines.append(f'{prefix}_jobs{{status="{status}"}} {depths.get(status, 0)}')
+    return '\n'.join(lines) + '\n'
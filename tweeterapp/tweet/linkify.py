@@ -0,0 +1,86 @@
+import re
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils.html import escape
+
+# One pass over the raw text for both kinds of token; the text between
+# tokens is escaped piecewise so entities like &#x27; are never linkified.
+TOKEN_RE = re.compile(r'([#@])(\w+)')
+LINK = '<a href="{}" class="text-blue-500 hover:underline">{}</a>'
+PLACEHOLDER = '__username__'
+
+
+@lru_cache(maxsize=None)
+def url_prefixes():
+    """(hashtag search prefix, profile prefix, profile suffix), resolved once."""
+    profile = reverse('profile', args=[PLACEHOLDER])
+    prefix, suffix = profile.split(PLACEHOLDER)
+    # %23 so the # is a query param, not an anchor
+    return reverse('tweet_list') + '?q=%23', prefix, suffix
+
+
+def mentions(text):
+    return {name for sigil, name in TOKEN_RE.findall(text or '') if sigil == '@'}
+
+
+def existing_mentions(texts):
+    """Usernames mentioned anywhere in texts that belong to real users, in one query."""
+    names = set()
+    for text in texts:
+        names |= mentions(text)
+    if not names:
+        return frozenset()
+    return frozenset(User.objects.filter(username__in=names).values_list('username', flat=True))
+
+
+async def aexisting_mentions(texts):
+    """existing_mentions for async views."""
+    names = set()
+    for text in texts:
+        names |= mentions(text)
+    if not names:
+        return frozenset()
+    return frozenset([name async for name in User.objects.filter(username__in=names).values_list('username', flat=True)])
+
+
+@lru_cache(maxsize=settings.LINKIFY_CACHE_SIZE)
+def _render(text, linked):
+    tag_prefix, profile_prefix, profile_suffix = url_prefixes()
+    parts = []
+    last = 0
+    for match in TOKEN_RE.finditer(text):
+        sigil, name = match.groups()
+        if sigil == '@' and name not in linked:
+            continue
+        parts.append(escape(text[last:match.start()]))
+        if sigil == '#':
+            url = tag_prefix + quote(name)
+        else:
+            url = profile_prefix + quote(name) + profile_suffix
+        parts.append(LINK.format(url, escape(match.group(0))))
+        last = match.end()
+    parts.append(escape(text[last:]))
+    return ''.join(parts)
+
+
+def render(text, known_users=None):
+    """
+    Escaped HTML for text with hashtags and mentions of existing users linked.
+    known_users is the page's batch of existing usernames; without it, the
+    mentions in this text are looked up on their own. Results are memoized
+    per (text, linked mentions) in a bounded LRU.
+    """
+    text = str(text or '')
+    names = mentions(text)
+    if not isinstance(known_users, (set, frozenset)):
+        known_users = existing_mentions([text])
+    return _render(text, frozenset(names & set(known_users)))
+
+
+def clear_cache():
+    _render.cache_clear()
+    url_prefixes.cache_clear()
@@ -0,0 +1,416 @@
+# Live updates over Server-Sent Events: new-tweet notices, like counts and
+# notification badges. Writers call publish(); the backend (LIVE_BACKEND)
+# carries each event to every web process, where a Broker fans it out to the
+# streams that want it. Under ASGI the streams are served by stream(), a bare
+# ASGI app that tweeterapp/asgi.py mounts ahead of Django: Django's handler
+# keeps a thread per request for as long as the response runs, while here an
+# idle stream costs a coroutine and a small buffer. Under WSGI, views.live
+# answers with what happened since the browser's last event and has
+# EventSource poll again.
+import asyncio
+import contextvars
+import itertools
+import json
+import logging
+import threading
+from collections import defaultdict, deque
+from datetime import timedelta
+from functools import lru_cache
+from importlib import import_module
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import aget_user
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DatabaseError, close_old_connections, transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import LiveEvent
+
+logger = logging.getLogger('tweet.live')
+
+
+class Event:
+    def __init__(self, id, name, data, user_id=None):
+        self.id = id
+        self.name = name
+        self.data = data
+        # Only this user's streams get it
+        self.user_id = user_id
+
+    @property
+    def key(self):
+        # A later event with the same key supersedes an undelivered earlier one
+        return self.name, self.data.get('id')
+
+    def encode(self):
+        return f'id: {self.id}\nevent: {self.name}\ndata: {json.dumps(self.data)}\n\n'
+
+
+def publish(name, data, user_id=None):
+    """Send an event to every live stream that wants it (just user_id's, if given)."""
+    get_backend().publish(name, data, user_id)
+
+
+class BaseLiveBackend:
+    def publish(self, name, data, user_id=None):
+        raise NotImplementedError
+
+    def recent(self, after, limit):
+        """Up to limit events with ids after `after`, oldest first."""
+        raise NotImplementedError
+
+    def latest(self):
+        """The newest event's id, or 0."""
+        raise NotImplementedError
+
+    async def listen(self, broker, after):
+        """Hand events after id `after` to broker.deliver() as they come, until cancelled."""
+        raise NotImplementedError
+
+
+class DatabaseBackend(BaseLiveBackend):
+    # Events are LiveEvent rows. Each web process polls for new ones once per
+    # LIVE_POLL_INTERVAL however many streams it holds, and prunes rows older
+    # than LIVE_RETENTION, which bounds how far back a reconnect can catch up.
+    def publish(self, name, data, user_id=None):
+        # After commit, so a stream never announces a write that rolled back
+        transaction.on_commit(lambda: LiveEvent.objects.create(name=name, data=data, recipient_id=user_id))
+
+    def recent(self, after, limit):
+        rows = LiveEvent.objects.filter(pk__gt=after).order_by('pk')[:limit]
+        return [Event(row.pk, row.name, row.data, row.recipient_id) for row in rows]
+
+    def latest(self):
+        return LiveEvent.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+    def prune(self):
+        LiveEvent.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=settings.LIVE_RETENTION)).delete()
+
+    def poll(self, after, prune=False):
+        try:
+            if prune:
+                self.prune()
+            return self.recent(after, settings.LIVE_REPLAY_LIMIT)
+        except DatabaseError:
+            logger.exception("Polling for live events failed")
+            close_old_connections()
+            return []
+
+    async def listen(self, broker, after):
+        loop = asyncio.get_running_loop()
+        pruned = loop.time()
+        while True:
+            await asyncio.sleep(settings.LIVE_POLL_INTERVAL)
+            prune = loop.time() - pruned > settings.LIVE_RETENTION / 10
+            if prune:
+                pruned = loop.time()
+            for event in await sync_to_async(self.poll)(after, prune):
+                broker.deliver(event)
+                after = event.id
+
+
+class LocalBackend(BaseLiveBackend):
+    # No storage: events go straight to this process's brokers, and a short
+    # history is kept for reconnects. Only for a single web process that runs
+    # its jobs eagerly, as in development.
+    def __init__(self):
+        self.events = deque(maxlen=settings.LIVE_REPLAY_LIMIT)
+        self.ids = itertools.count(1)
+        self.brokers = set()
+        self.lock = threading.Lock()
+
+    def publish(self, name, data, user_id=None):
+        with self.lock:
+            event = Event(next(self.ids), name, data, user_id)
+            self.events.append(event)
+        for broker in list(self.brokers):
+            broker.deliver_threadsafe(event)
+
+    def recent(self, after, limit):
+        return [event for event in list(self.events) if event.id > after][:limit]
+
+    def latest(self):
+        return self.events[-1].id if self.events else 0
+
+    async def listen(self, broker, after):
+        self.brokers.add(broker)
+        try:
+            await asyncio.Future()
+        finally:
+            self.brokers.discard(broker)
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    return _load_backend(settings.LIVE_BACKEND)
+
+
+class Subscriber:
+    """One open stream: what it listens for and the events it hasn't been sent yet."""
+
+    def __init__(self, user_id=None, tweet_ids=(), feed=False, last_id=0):
+        self.user_id = user_id
+        self.tweet_ids = set(tweet_ids)
+        self.feed = feed
+        self.last_id = last_id
+        self.pending = {}
+        self.overflowed = False
+        self.closed = False
+        self.wakeup = asyncio.Event()
+
+    def wants(self, event):
+        # Keep in step with Broker.audience()
+        if event.user_id is not None:
+            return event.user_id == self.user_id
+        if event.name == 'tweet':
+            return self.feed
+        if event.name == 'like':
+            return event.data['id'] in self.tweet_ids
+        return True
+
+    def put(self, event):
+        if event.id <= self.last_id:
+            # Sent already; replay and live delivery can overlap
+            return
+        if event.key in self.pending:
+            del self.pending[event.key]
+        elif len(self.pending) >= settings.LIVE_QUEUE_SIZE:
+            # A client this far behind gets a reset instead of the backlog
+            self.overflowed = True
+            self.wakeup.set()
+            return
+        self.pending[event.key] = event
+        self.wakeup.set()
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+
+    def drain(self):
+        events = sorted(self.pending.values(), key=lambda event: event.id)
+        self.pending = {}
+        if events:
+            self.last_id = events[-1].id
+        return events
+
+    async def get(self, timeout):
+        """The pending events, waiting up to timeout for some; [] on timeout."""
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except TimeoutError:
+            return []
+        self.wakeup.clear()
+        return self.drain()
+
+
+class Broker:
+    """Fans events out to the streams open on one event loop."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.loop = asyncio.get_running_loop()
+        self.streams = set()
+        self.feed = set()
+        self.by_user = defaultdict(set)
+        self.by_tweet = defaultdict(set)
+        self.last_id = 0
+        self.listener = None
+        self.ready = None
+
+    async def subscribe(self, subscriber):
+        if self.listener is None:
+            self.ready = asyncio.Event()
+            # A fresh context: the listener outlives the request that starts it
+            self.listener = contextvars.Context().run(self.loop.create_task, self.listen())
+        self.streams.add(subscriber)
+        if subscriber.feed:
+            self.feed.add(subscriber)
+        if subscriber.user_id is not None:
+            self.by_user[subscriber.user_id].add(subscriber)
+        for tweet_id in subscriber.tweet_ids:
+            self.by_tweet[tweet_id].add(subscriber)
+        await self.ready.wait()
+
+    def unsubscribe(self, subscriber):
+        self.streams.discard(subscriber)
+        self.feed.discard(subscriber)
+        for index, key in [(self.by_user, subscriber.user_id), *((self.by_tweet, pk) for pk in subscriber.tweet_ids)]:
+            if key in index:
+                index[key].discard(subscriber)
+                if not index[key]:
+                    del index[key]
+        if not self.streams and self.listener is not None:
+            # Nobody left to deliver to; stop polling
+            self.listener.cancel()
+            self.listener = None
+
+    async def listen(self):
+        try:
+            self.last_id = await sync_to_async(self.backend.latest)()
+            self.ready.set()
+            await self.backend.listen(self, self.last_id)
+        except Exception:
+            logger.exception("Live event listener stopped")
+            # The next stream to open starts a new one
+            self.listener = None
+        finally:
+            self.ready.set()
+
+    def audience(self, event):
+        if event.user_id is not None:
+            return self.by_user.get(event.user_id, ())
+        if event.name == 'tweet':
+            return self.feed
+        if event.name == 'like':
+            return self.by_tweet.get(event.data['id'], ())
+        return self.streams
+
+    def deliver(self, event):
+        self.last_id = max(self.last_id, event.id)
+        for subscriber in self.audience(event):
+            subscriber.put(event)
+
+    def deliver_threadsafe(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self.deliver, event)
+        except RuntimeError:
+            # Its loop has closed
+            pass
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None or _broker.loop is not asyncio.get_running_loop():
+        _broker = Broker(get_backend())
+    return _broker
+
+
+def subscriber_for(request, user):
+    tweet_ids = [int(pk) for pk in request.GET.get('tweets', '').split(',') if pk.isdigit()]
+    return Subscriber(
+        user_id=user.pk if user.is_authenticated else None,
+        tweet_ids=tweet_ids[:settings.LIVE_MAX_TWEETS],
+        feed=request.GET.get('feed') == '1',
+    )
+
+
+def last_event_id(request):
+    # EventSource sends the header when it reconnects
+    value = request.headers.get('Last-Event-ID', request.GET.get('after', ''))
+    return int(value) if value.isdigit() else None
+
+
+def catch_up(subscriber, backend, after):
+    """Queue for subscriber what it missed after event `after`."""
+    subscriber.last_id = after
+    events = backend.recent(after, settings.LIVE_REPLAY_LIMIT)
+    if len(events) == settings.LIVE_REPLAY_LIMIT:
+        subscriber.overflowed = True
+    for event in events:
+        if subscriber.wants(event):
+            subscriber.put(event)
+    return events[-1].id if events else after
+
+
+def reset(last_id):
+    # The page is out of date; the browser should reload rather than patch it
+    return f'id: {last_id}\nevent: reset\ndata: {{}}\n\n'
+
+
+def poll(request):
+    """The WSGI endpoint's body: events since the browser's last one, then come back later."""
+    backend = get_backend()
+    subscriber = subscriber_for(request, request.user)
+    after = last_event_id(request)
+    body = f'retry: {settings.LIVE_POLL_RETRY * 1000}\n\n'
+    if after is None:
+        return body + f'id: {backend.latest()}\n\n'
+    latest = catch_up(subscriber, backend, after)
+    if subscriber.overflowed:
+        return body + reset(latest)
+    events = subscriber.drain()
+    if not events or events[-1].id < latest:
+        # Move the browser past events that weren't for it
+        body += f'id: {latest}\n\n'
+    return body + ''.join(event.encode() for event in events)
+
+
+@lru_cache(maxsize=None)
+def path():
+    return reverse('live')
+
+
+HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    # Don't let a proxy buffer the stream
+    (b'x-accel-buffering', b'no'),
+]
+
+
+async def respond(send, status, body=b'', headers=()):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [*HEADERS, *headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def stream(scope, receive, send):
+    """ASGI app for the live endpoint: one long-lived event stream per page."""
+    request = ASGIRequest(scope, BytesIO())
+    if request.method != 'GET':
+        return await respond(send, 405, headers=[(b'allow', b'GET')])
+    broker = get_broker()
+    if len(broker.streams) >= settings.LIVE_MAX_STREAMS:
+        # Full. EventSource gives up on an error status, so have it retry later instead
+        return await respond(send, 200, f'retry: {settings.LIVE_POLL_RETRY * 1000}\n\n'.encode())
+
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    subscriber = subscriber_for(request, await aget_user(request))
+    after = last_event_id(request)
+
+    async def watch():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        subscriber.close()
+
+    watcher = asyncio.create_task(watch())
+    await broker.subscribe(subscriber)
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': HEADERS})
+        head = f'retry: {settings.LIVE_RETRY * 1000}\n\n'
+        if after is None or after > broker.last_id:
+            # Tell the browser where it starts, so a reconnect can catch up
+            subscriber.last_id = broker.last_id
+            head += f'id: {broker.last_id}\n\n'
+        else:
+            await sync_to_async(catch_up)(subscriber, broker.backend, after)
+        await send({'type': 'http.response.body', 'body': head.encode(), 'more_body': True})
+
+        while not subscriber.closed:
+            # send() waits while the client's socket is backed up, and meanwhile
+            # events pile up, coalesced, in subscriber.pending
+            events = await subscriber.get(settings.LIVE_HEARTBEAT)
+            if subscriber.closed:
+                break
+            if subscriber.overflowed:
+                await send({'type': 'http.response.body', 'body': reset(broker.last_id).encode()})
+                return
+            body = ''.join(event.encode() for event in events) or ': ping\n\n'
+            await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+    except OSError:
+        # The client went away mid-send
+        pass
+    finally:
+        watcher.cancel()
+        broker.unsubscribe(subscriber)
@@ -0,0 +1,173 @@
+import json
+import math
+import platform
+import random
+import time
+from contextlib import ExitStack
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from tweet.models import Tag, Tweet
+from tweet.pagination import CursorPaginator
+
+ENDPOINTS = (
+    'feed', 'feed_page_2', 'search', 'hashtag', 'following',
+    'profile', 'profile_likes', 'my_tweets', 'tweet_detail', 'notifications',
+)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the app's real URL routes in-process and report latency "
+        "percentiles, queries per request and throughput for each endpoint. "
+        "Run seed_benchmark first for a meaningful dataset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Measured requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=10, help="Unmeasured requests per endpoint.")
+        parser.add_argument('--endpoint', action='append', choices=ENDPOINTS,
+                            help="Endpoint to run; repeat for several. Defaults to all.")
+        parser.add_argument('--user', help="Username to browse as. Defaults to the first seeded user.")
+        parser.add_argument('--anonymous', action='store_true', help="Browse logged out; skips login-only endpoints.")
+        parser.add_argument('--output', help="Write results as JSON to this path.")
+        parser.add_argument('--compare', help="Earlier JSON results to print p50/p95 deltas against.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.tweet_ids = list(Tweet.objects.order_by('-id').values_list('id', flat=True)[:1000])
+        self.usernames = list(User.objects.order_by('-profile__followers_count').values_list('username', flat=True)[:200])
+        self.tags = list(Tag.objects.values_list('name', flat=True)[:100])
+        if not self.tweet_ids:
+            raise CommandError("No tweets to browse; run seed_benchmark first.")
+        self.second_page = CursorPaginator(Tweet.objects.all(), 10).get_page().next_cursor
+
+        client = Client()
+        if not options['anonymous']:
+            user = User.objects.get(username=options['user']) if options['user'] else (
+                User.objects.filter(username__startswith='bench_').order_by('id').first()
+                or User.objects.order_by('id').first()
+            )
+            client.force_login(user)
+        endpoints = options['endpoint'] or ENDPOINTS
+        if options['anonymous']:
+            endpoints = [name for name in endpoints if name not in ('following', 'my_tweets', 'notifications')]
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name in endpoints:
+                results[name] = self.run(client, name, options['warmup'], options['requests'])
+
+        self.report(results, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'meta': self.meta(options), 'endpoints': results}, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}.")
+
+    def request_for(self, name):
+        if name == 'feed':
+            return reverse('tweet_list'), {}
+        if name == 'feed_page_2':
+            return reverse('tweet_list'), {'cursor': self.second_page}
+        if name == 'search':
+            return reverse('tweet_list'), {'q': self.rng.choice(('coffee', 'django release', 'good morning', 'bug fix'))}
+        if name == 'hashtag':
+            return reverse('tweet_list'), {'q': '#' + self.rng.choice(self.tags or ['django'])}
+        if name == 'following':
+            return reverse('home_timeline'), {}
+        if name == 'profile':
+            return reverse('profile', args=[self.rng.choice(self.usernames)]), {}
+        if name == 'profile_likes':
+            return reverse('profile', args=[self.rng.choice(self.usernames)]), {'tab': 'likes'}
+        if name == 'my_tweets':
+            return reverse('my_tweets'), {}
+        if name == 'tweet_detail':
+            return reverse('tweet_detail', args=[self.rng.choice(self.tweet_ids)]), {}
+        return reverse('notifications'), {}
+
+    def run(self, client, name, warmup, n):
+        requests = [self.request_for(name) for _ in range(warmup + n)]
+        for url, data in requests[:warmup]:
+            client.get(url, data)
+
+        latencies = []
+        queries = []
+        started = time.perf_counter()
+        for url, data in requests[warmup:]:
+            # Every alias: with DATABASE_REPLICAS set, page reads go to the replicas
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+                t0 = time.perf_counter()
+                response = client.get(url, data)
+                latencies.append((time.perf_counter() - t0) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f"{name}: {url} returned {response.status_code}")
+            queries.append(sum(len(c) for c in captured))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests': n,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(sum(latencies) / n, 3),
+            'queries_mean': round(sum(queries) / n, 2),
+            'queries_max': max(queries),
+            'rps': round(n / elapsed, 1),
+        }
+
+    def report(self, results, compare):
+        previous = {}
+        if compare:
+            with open(compare) as f:
+                previous = json.load(f)['endpoints']
+        self.stdout.write(
+            f"{'endpoint':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}{'req/s':>10}"
+        )
+        for name, r in results.items():
+            line = (
+                f"{name:<16}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+                f"{r['queries_mean']:>10.1f}{r['rps']:>10.1f}"
+            )
+            if name in previous:
+                before = previous[name]
+                deltas = [
+                    (r[key] - before[key]) / before[key] * 100 if before[key] else 0
+                    for key in ('p50_ms', 'p95_ms')
+                ]
+                line += f"   p50 {deltas[0]:+.0f}%  p95 {deltas[1]:+.0f}%"
+            self.stdout.write(line)
+        self.stdout.write(f"Queries are summed over {', '.join(connections)}.")
+
+    def meta(self, options):
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'database_pool': bool(connection.settings_dict['OPTIONS'].get('pool')),
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'replicas': list(settings.DATABASE_REPLICAS),
+            'tweets': Tweet.objects.count(),
+            'users': User.objects.count(),
+            'anonymous': options['anonymous'],
+            'requests': options['requests'],
+        }
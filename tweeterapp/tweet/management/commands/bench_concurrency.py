@@ -0,0 +1,138 @@
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from tweet.models import Tweet
+
+from .bench import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a running server with concurrent slow clients and report "
+        "throughput and latency at each concurrency level. Run it against the "
+        "WSGI and the ASGI deployment to compare how far one worker scales."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the running server.")
+        parser.add_argument('--concurrency', type=int, action='append',
+                            help="Concurrent clients; repeat for several levels. Defaults to 1, 10, 50 and 100.")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per concurrency level.")
+        parser.add_argument('--send-delay', type=float, default=0.2,
+                            help="Seconds each client stalls halfway through sending its request.")
+        parser.add_argument('--timeout', type=float, default=30.0, help="Seconds before a request counts as failed.")
+        parser.add_argument('--label', default='', help="Name for this run, e.g. wsgi or asgi.")
+        parser.add_argument('--output', help="Write results as JSON to this path.")
+        parser.add_argument('--compare', help="Earlier JSON results to print throughput deltas against.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError("--url must be a plain http:// URL.")
+        self.host, self.port = url.hostname, url.port or 80
+        self.prefix = url.path.rstrip('/')
+        self.paths = self.read_paths()
+        self.rng = random.Random(options['seed'])
+
+        results = {}
+        for clients in options['concurrency'] or (1, 10, 50, 100):
+            results[str(clients)] = asyncio.run(self.level(clients, options))
+
+        self.report(results, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'meta': self.meta(options), 'levels': results}, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}.")
+
+    def read_paths(self):
+        # Anonymous hot read paths; the server must be using this database
+        tweet_ids = list(Tweet.objects.order_by('-id').values_list('id', flat=True)[:200])
+        usernames = list(User.objects.order_by('-profile__followers_count').values_list('username', flat=True)[:50])
+        if not tweet_ids:
+            raise CommandError("No tweets to browse; run seed_benchmark first.")
+        return (
+            [reverse('tweet_list')]
+            + [reverse('tweet_detail', args=[pk]) for pk in tweet_ids]
+            + [reverse('profile', args=[username]) for username in usernames]
+        )
+
+    async def level(self, clients, options):
+        deadline = time.monotonic() + options['duration']
+        latencies, errors = [], []
+        started = time.monotonic()
+        await asyncio.gather(*[
+            self.client(deadline, options, latencies, errors) for _ in range(clients)
+        ])
+        elapsed = time.monotonic() - started
+        latencies.sort()
+        return {
+            'clients': clients,
+            'requests': len(latencies),
+            'errors': len(errors),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+        }
+
+    async def client(self, deadline, options, latencies, errors):
+        while time.monotonic() < deadline:
+            path = self.prefix + self.rng.choice(self.paths)
+            t0 = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(self.request(path, options['send_delay']), options['timeout'])
+            except (OSError, asyncio.TimeoutError) as e:
+                errors.append(repr(e))
+                continue
+            if status != 200:
+                errors.append(status)
+                continue
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    async def request(self, path, send_delay):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            # A slow client: the server sees half a request, then a pause
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\n'.encode())
+            await writer.drain()
+            await asyncio.sleep(send_delay)
+            writer.write(b'User-Agent: bench_concurrency\r\nConnection: close\r\n\r\n')
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        status_line = response.split(b'\r\n', 1)[0].split()
+        return int(status_line[1]) if len(status_line) > 1 else 0
+
+    def report(self, results, compare):
+        previous = {}
+        if compare:
+            with open(compare) as f:
+                previous = json.load(f)['levels']
+        self.stdout.write(f"{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for level, r in results.items():
+            line = (
+                f"{r['clients']:>8}{r['rps']:>10.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+                f"{r['p99_ms']:>10.1f}{r['errors']:>8}"
+            )
+            if level in previous and previous[level]['rps']:
+                line += f"   req/s {(r['rps'] - previous[level]['rps']) / previous[level]['rps'] * 100:+.0f}%"
+            self.stdout.write(line)
+
+    def meta(self, options):
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'label': options['label'],
+            'url': options['url'],
+            'duration': options['duration'],
+            'send_delay': options['send_delay'],
+        }
@@ -0,0 +1,64 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from tweet import linkify
+from tweet.models import Tweet
+
+WORDS = ['django', 'python', 'hello', 'world', 'shipping', 'today', 'release', 'coffee', 'bug', 'fixed']
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark for the linkify_tweet renderer: per-tweet cost of a "
+        "cold render (cache cleared) and a warm render (LRU hit)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tweets', type=int, default=1000, help="Distinct texts to render.")
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--from-db', action='store_true', help="Use the newest stored tweets instead of synthetic text.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        texts = self.texts(options)
+        if not texts:
+            self.stdout.write(self.style.WARNING("No tweets to render."))
+            return
+
+        started = time.perf_counter()
+        known = linkify.existing_mentions(texts)
+        lookup = time.perf_counter() - started
+
+        cold, warm = [], []
+        for _ in range(options['rounds']):
+            linkify.clear_cache()
+            cold.append(self.time_pass(texts, known))
+            warm.append(self.time_pass(texts, known))
+
+        per_tweet = lambda seconds: min(seconds) / len(texts) * 1e6
+        self.stdout.write(f"{len(texts)} tweet(s), best of {options['rounds']} round(s)")
+        self.stdout.write(f"  mention lookup: {lookup * 1e3:.2f} ms for the batch")
+        self.stdout.write(f"  cold render:    {per_tweet(cold):.2f} us/tweet")
+        self.stdout.write(f"  warm render:    {per_tweet(warm):.2f} us/tweet")
+
+    def time_pass(self, texts, known):
+        started = time.perf_counter()
+        for text in texts:
+            linkify.render(text, known)
+        return time.perf_counter() - started
+
+    def texts(self, options):
+        if options['from_db']:
+            return list(
+                Tweet.objects.order_by('-created_at', '-id').values_list('text', flat=True)[:options['tweets']]
+            )
+        rng = random.Random(options['seed'])
+        texts = []
+        for i in range(options['tweets']):
+            words = rng.choices(WORDS, k=rng.randint(5, 30))
+            words.insert(rng.randrange(len(words)), f'#{rng.choice(WORDS)}')
+            words.insert(rng.randrange(len(words)), f'@user{rng.randrange(100)}')
+            texts.append(f"{i}: " + ' '.join(words) + " <it's>")
+        return texts
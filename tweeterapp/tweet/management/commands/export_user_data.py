@@ -0,0 +1,31 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from tweet import archive
+
+
+class Command(BaseCommand):
+    help = "Write a user's tweets, likes, comments and follows as NDJSON (see tweet/archive.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--output', '-o', help="File to write; standard output by default.")
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="Rows fetched per round trip from each table's cursor.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}.")
+        lines = archive.lines(user, options['chunk_size'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        written = 0
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line)
+                written += 1
+        self.stderr.write(f"Wrote {written} records to {options['output']}.")
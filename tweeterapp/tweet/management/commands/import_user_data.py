@@ -0,0 +1,53 @@
+import sys
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from tweet import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a user's NDJSON archive from export_user_data, in batches of "
+        "bulk inserts with one transaction each, reporting the throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Archive to read, or - for standard input.")
+        parser.add_argument('--user', help="Load into this existing user instead of the exported username.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per insert and transaction.")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['user']!r}.")
+        loader = archive.Loader(user, options['batch_size'])
+        f = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8')
+        loaded, skipped = Counter(), Counter()
+        started = time.perf_counter()
+        try:
+            for kind, n, missed in loader.load(f):
+                loaded[kind] += n
+                skipped[kind] += missed
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"  {kind}s: {loaded[kind]} ({sum(loaded.values()) / elapsed:.0f} rows/s)")
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+        if loader.exported_username is None:
+            raise CommandError("The archive has no account record.")
+        elapsed = time.perf_counter() - started
+        total = sum(loaded.values())
+        for kind in loaded:
+            if skipped[kind]:
+                self.stdout.write(f"Skipped {skipped[kind]} {kind}s whose tweet or account isn't here.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {total} rows into {loader.user.username} in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s)."))
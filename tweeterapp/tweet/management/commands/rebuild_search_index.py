@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tweet.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index from the tweet table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backend = get_backend(options['database'])
+        started = time.perf_counter()
+        indexed = backend.rebuild(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} tweet(s) with {type(backend).__name__} in {elapsed:.1f}s."
+        ))
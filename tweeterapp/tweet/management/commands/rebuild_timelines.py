@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from tweet import timeline
+from tweet.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized home timelines from the current follow graph."
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Only rebuild these users' timelines.")
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.order_by('pk')
+        if options['usernames']:
+            profiles = profiles.filter(user__username__in=options['usernames'])
+
+        rebuilt = 0
+        for profile in profiles.iterator(chunk_size=500):
+            timeline.rebuild(profile)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} timeline(s)."))
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from tweet import trending
+from tweet.models import TagActivity, Tweet
+
+
+class Command(BaseCommand):
+    help = "Rebuild hourly trending buckets from tweet tags and prune expired ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=max(settings.TRENDING_WINDOWS.values()),
+                            help="How far back to rebuild (defaults to the longest window).")
+
+    def handle(self, *args, **options):
+        since = trending.bucket_for(timezone.now()) - timedelta(hours=options['hours'])
+        links = (
+            Tweet.tags.through.objects.filter(tweet__created_at__gte=since)
+            .annotate(bucket=TruncHour('tweet__created_at'))
+            .values('tag_id', 'bucket')
+            .annotate(n=Count('id'))
+        )
+        with transaction.atomic():
+            # Buckets older than the longest window are never read again
+            oldest = trending.bucket_for(timezone.now()) - timedelta(hours=max(settings.TRENDING_WINDOWS.values()))
+            pruned, _ = TagActivity.objects.filter(bucket__lt=min(since, oldest)).delete()
+            TagActivity.objects.filter(bucket__gte=since).delete()
+            buckets = TagActivity.objects.bulk_create(
+                [TagActivity(tag_id=row['tag_id'], bucket=row['bucket'], count=row['n']) for row in links],
+                batch_size=1000,
+            )
+        trending.clear_cache()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(buckets)} bucket(s), pruned {pruned}."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from tweet import counters
+from tweet.models import Profile, Tweet
+
+
+class Command(BaseCommand):
+    help = "Repair drift in the denormalized like/comment/follower/tweet counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Rows per UPDATE, to keep transactions short on big tables.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for label, model, recount in (
+            ('tweets', Tweet, counters.recount_tweets),
+            ('profiles', Profile, counters.recount_profiles),
+        ):
+            updated = 0
+            last_pk = 0
+            while True:
+                pks = list(
+                    model.objects.filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', flat=True)[:batch_size]
+                )
+                if not pks:
+                    break
+                updated += recount(model.objects.filter(pk__in=pks))
+                last_pk = pks[-1]
+            self.stdout.write(f"Recounted {updated} {label}.")
+        self.stdout.write(self.style.SUCCESS("Counters are in sync."))
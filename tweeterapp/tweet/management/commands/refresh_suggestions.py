@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from tweet import recommendations
+from tweet.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Recompute stored who-to-follow candidates (run periodically, e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Only refresh these users.")
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.order_by('pk')
+        if options['usernames']:
+            profiles = profiles.filter(user__username__in=options['usernames'])
+
+        refreshed = 0
+        for profile in profiles.iterator(chunk_size=500):
+            recommendations.refresh(profile)
+            refreshed += 1
+        self.stdout.write(self.style.SUCCESS(f"Refreshed suggestions for {refreshed} profile(s)."))
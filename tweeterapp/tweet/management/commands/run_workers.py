@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+# tweet.jobs is imported inside the functions below: a spawned worker process
+# unpickles serve() before Django is set up, so this module mustn't touch models.
+
+
+def _work_thread(worker, stop, batch_size, burst):
+    from tweet import jobs
+
+    # Each thread has its own connections; don't leak them
+    close_old_connections()
+    try:
+        return jobs.work(worker, stop, batch_size, burst)
+    finally:
+        close_old_connections()
+
+
+def serve(threads, batch_size, burst):
+    """Run jobs on this many threads until SIGTERM/SIGINT or, with burst, an empty queue."""
+    django.setup()
+    from tweet import jobs
+
+    stop = threading.Event()
+    handlers = {sig: signal.signal(sig, lambda *args: stop.set()) for sig in (signal.SIGTERM, signal.SIGINT)}
+    prefix = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    try:
+        if threads == 1:
+            # Stay on this thread (and its connection)
+            return jobs.work(f'{prefix}:0', stop, batch_size, burst)
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='jobs') as pool:
+            futures = [pool.submit(_work_thread, f'{prefix}:{i}', stop, batch_size, burst) for i in range(threads)]
+            return sum(future.result() for future in futures)
+    finally:
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (tweet.jobs): timeline fan-out, search "
+        "indexing, hashtags, notifications and image processing. Runs until "
+        "stopped unless --burst is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help="Worker processes to start.")
+        parser.add_argument('--threads', type=int, default=1, help="Worker threads per process.")
+        parser.add_argument('--batch-size', type=int, help="Jobs claimed at a time. Defaults to JOBS_BATCH_SIZE.")
+        parser.add_argument('--burst', action='store_true', help="Exit once no job is runnable.")
+
+    def handle(self, *args, **options):
+        threads, batch_size, burst = max(options['threads'], 1), options['batch_size'], options['burst']
+        if options['processes'] <= 1:
+            done = serve(threads, batch_size, burst)
+            if burst:
+                self.stdout.write(self.style.SUCCESS(f"Ran {done} job(s)."))
+            return
+
+        # Children must not share the parent's database connections or pool
+        connections.close_all()
+        for connection in connections.all(initialized_only=True):
+            if hasattr(connection, 'close_pool'):
+                connection.close_pool()
+        processes = [
+            multiprocessing.Process(target=serve, args=(threads, batch_size, burst), name=f'jobs-{i}')
+            for i in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+
+        def shutdown(*args):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        for process in processes:
+            process.join()
+        self.stdout.write(f"Stopped {len(processes)} worker process(es).")
@@ -0,0 +1,69 @@
+import random
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from tweet.models import Profile
+from tweet.recommendations import score_candidates
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline quality check for who-to-follow: hide a fraction of sampled "
+        "users' follow edges, recommend from the rest of the graph and report "
+        "how many hidden edges come back in the top k."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=500, help="Users to evaluate.")
+        parser.add_argument('--holdout', type=float, default=0.2, help="Fraction of each user's follows to hide.")
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--min-follows', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        k = options['k']
+
+        follows_of = {}
+        for follower_id, followee_id in Profile.follows.through.objects.values_list('from_profile_id', 'to_profile_id').iterator(chunk_size=10000):
+            follows_of.setdefault(follower_id, set()).add(followee_id)
+        in_degree = Counter(followee for followees in follows_of.values() for followee in followees)
+
+        eligible = [pid for pid, followees in follows_of.items() if len(followees) >= options['min_follows']]
+        sample = rng.sample(eligible, min(options['sample'], len(eligible)))
+        if not sample:
+            self.stdout.write(self.style.WARNING("No users with enough follows to evaluate."))
+            return
+
+        # Enough of the most followed accounts to fill k after dropping anyone a user follows
+        pool = k + max(len(follows_of[pid]) for pid in sample) + 1
+        most_followed = sorted(in_degree.items(), key=lambda item: (-item[1], item[0]))[:pool]
+
+        totals = {'model': Counter(), 'popular': Counter()}
+        for profile_id in sample:
+            followees = sorted(follows_of[profile_id])
+            hidden = set(rng.sample(followees, max(1, int(len(followees) * options['holdout']))))
+            visible = set(followees) - hidden
+            # Popularity as seen without the hidden edges
+            popular = sorted(
+                ((pid, followers - (pid in hidden)) for pid, followers in most_followed),
+                key=lambda item: (-item[1], item[0]),
+            )
+
+            for name, graph in (('model', follows_of), ('popular', {})):
+                ranked = [cid for cid, _, _ in score_candidates(profile_id, visible, graph, popular, k)]
+                hits = len(hidden.intersection(ranked))
+                totals[name]['hits'] += hits
+                totals[name]['hit_users'] += bool(hits)
+                totals[name]['recommended'] += len(ranked)
+                totals[name]['hidden'] += len(hidden)
+
+        self.stdout.write(f"Evaluated {len(sample)} user(s), k={k}, holdout={options['holdout']:.0%}")
+        for name, total in totals.items():
+            precision = total['hits'] / total['recommended'] if total['recommended'] else 0.0
+            recall = total['hits'] / total['hidden'] if total['hidden'] else 0.0
+            hit_rate = total['hit_users'] / len(sample)
+            self.stdout.write(
+                f"  {name:<8} precision@{k}={precision:.3f} recall@{k}={recall:.3f} hit-rate={hit_rate:.3f}"
+            )
@@ -0,0 +1,174 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tweet.models import Comment, Like, Profile, Tweet
+
+WORDS = (
+    'the a to and of in is it you that for on with this was just my so at be have '
+    'are not but what all when we love like good time day today new people know '
+    'coffee code python django release bug fix ship weekend music game news team '
+    'work home city night morning build launch read think great happy'
+).split()
+TAGS = (
+    'django python webdev opensource coding devlife music news sports gaming '
+    'travel food photography ai startup design books movies fitness weekend'
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic dataset for benchmarking: users with profiles, a "
+        "power-law follow graph, tweets with hashtags and mentions, likes and "
+        "comments, all inserted in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--tweets', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=30, help="Mean accounts followed per user.")
+        parser.add_argument('--likes', type=int, default=50000)
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help="Power-law exponent for who gets followed and liked.")
+        parser.add_argument('--prefix', default='bench', help="Username prefix for generated users.")
+        parser.add_argument('--password', default='bench', help="Password set on every generated user.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f"Users named {prefix}_* already exist; pass another --prefix.")
+
+        started = time.perf_counter()
+        users = self.step('users', self.create_users, prefix, options['users'], options['password'])
+        # Rank users by how followable they are; rank r gets weight 1 / r**alpha
+        ranked = users[:]
+        self.rng.shuffle(ranked)
+        weights = list(accumulate(1 / (rank + 1) ** options['alpha'] for rank in range(len(ranked))))
+
+        self.step('follows', self.create_follows, users, ranked, weights, options['follows'])
+        # Timeline fan-out on write reads followers_count, so settle it first
+        call_command('recount', stdout=self.stdout)
+        tweets = self.step('tweets', self.create_tweets, users, ranked, weights, options['tweets'])
+        self.step('likes', self.create_likes, users, tweets, options['likes'], options['alpha'])
+        self.step('comments', self.create_comments, users, tweets, options['comments'])
+        call_command('recount', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.perf_counter() - started:.1f}s."))
+
+    def step(self, label, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        count = len(result) if isinstance(result, list) else result
+        self.stdout.write(f"  {label}: {count} in {time.perf_counter() - started:.1f}s")
+        return result
+
+    def batches(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def create_users(self, prefix, n, password):
+        # One hash for everyone: hashing per user would dominate the run
+        password = make_password(password)
+        user_ids = []
+        for batch in self.batches(User(username=f'{prefix}_{i}', password=password) for i in range(n)):
+            User.objects.bulk_create(batch)
+            # SQLite and Postgres return pks from bulk_create; others need a lookup
+            ids = dict(User.objects.filter(username__in=[u.username for u in batch]).values_list('username', 'id'))
+            Profile.objects.bulk_create([
+                Profile(user_id=ids[u.username], bio=self.sentence(5, 15)) for u in batch
+            ])
+            user_ids.extend(ids[u.username] for u in batch)
+        return list(
+            User.objects.filter(id__in=user_ids).values_list('id', 'username', 'profile__id').order_by('id')
+        )
+
+    def create_follows(self, users, ranked, weights, mean):
+        Follow = Profile.follows.through
+        created = 0
+        for batch in self.batches(self.follow_edges(users, ranked, weights, mean)):
+            Follow.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+        return created
+
+    def follow_edges(self, users, ranked, weights, mean):
+        for _, _, profile_id in users:
+            k = min(int(self.rng.expovariate(1 / mean)) + 1, len(users) - 1)
+            followed = {ranked[i][2] for i in self.sample_indices(weights, k)}
+            followed.discard(profile_id)
+            for followed_id in followed:
+                yield Profile.follows.through(from_profile_id=profile_id, to_profile_id=followed_id)
+
+    def create_tweets(self, users, ranked, weights, n):
+        # Popular accounts post more, like real feeds
+        tweet_ids = []
+        authors = [ranked[i] for i in self.sample_indices(weights, n, unique=False)]
+        for batch in self.batches(authors):
+            created = Tweet.objects.bulk_import(
+                [Tweet(user_id=user_id, text=self.tweet_text(users)) for user_id, _, _ in batch],
+                batch_size=self.batch_size,
+            )
+            tweet_ids.extend(tweet.pk for tweet in created)
+        return tweet_ids
+
+    def create_likes(self, users, tweets, n, alpha):
+        # A few tweets go viral; most get a handful of likes
+        weights = list(accumulate(1 / (rank + 1) ** alpha for rank in range(len(tweets))))
+        order = tweets[:]
+        self.rng.shuffle(order)
+        now = timezone.now()
+        created = 0
+        rows = (
+            Like(
+                tweet_id=order[i],
+                user_id=self.rng.choice(users)[0],
+                created_at=now - timedelta(seconds=self.rng.randrange(7 * 24 * 3600)),
+            )
+            for i in self.sample_indices(weights, n, unique=False)
+        )
+        for batch in self.batches(rows):
+            Like.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+        return created
+
+    def create_comments(self, users, tweets, n):
+        created = 0
+        rows = (
+            Comment(tweet_id=self.rng.choice(tweets), user_id=self.rng.choice(users)[0], text=self.sentence(3, 20))
+            for _ in range(n)
+        )
+        for batch in self.batches(rows):
+            Comment.objects.bulk_create(batch)
+            created += len(batch)
+        return created
+
+    def sample_indices(self, cum_weights, k, unique=True):
+        picks = self.rng.choices(range(len(cum_weights)), cum_weights=cum_weights, k=k)
+        return set(picks) if unique else picks
+
+    def sentence(self, low, high):
+        return ' '.join(self.rng.choices(WORDS, k=self.rng.randint(low, high))).capitalize()
+
+    def tweet_text(self, users):
+        words = self.rng.choices(WORDS, k=self.rng.randint(4, 30))
+        for _ in range(self.rng.choices((0, 1, 2, 3), (50, 30, 15, 5))[0]):
+            words.insert(self.rng.randrange(len(words) + 1), '#' + self.rng.choice(TAGS))
+        if self.rng.random() < 0.2:
+            words.insert(self.rng.randrange(len(words) + 1), '@' + self.rng.choice(users)[1])
+        return ' '.join(words)[:280]
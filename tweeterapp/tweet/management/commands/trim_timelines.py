@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from tweet import timeline
+from tweet.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Cut home timeline inboxes back to TIMELINE_SIZE entries (run periodically, e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Only trim these users' timelines.")
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.order_by('pk')
+        if options['usernames']:
+            profiles = profiles.filter(user__username__in=options['usernames'])
+
+        dropped = timeline.trim(profiles.values_list('pk', flat=True).iterator(chunk_size=500))
+        self.stdout.write(self.style.SUCCESS(f"Dropped {dropped} timeline entries."))
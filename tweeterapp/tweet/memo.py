@@ -0,0 +1,77 @@
+# Per-user data read on nearly every request: the signed-in user with their
+# profile (loaded by tweet.auth.CachedModelBackend) and, in tweet.graph, their
+# side of the follow graph. Values are kept in this process's 'local' cache in front of the
+# shared 'default' one, keyed by a version stored in the shared cache; a write
+# bumps the version, which retires every process's copy at once.
+#
+# That only works when every process sees the same 'default' cache
+# (CACHE_SHARED). Otherwise values are memoized for one request only.
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+
+from . import perf, routers
+
+# Profile columns updated with F() expressions, without a save() or a bump.
+# Memoized profiles leave them deferred: reading one queries the current value,
+# and saving the profile can't write a stale one back.
+COUNTERS = ('followers_count', 'following_count', 'tweets_count')
+
+
+def _version_key(name, pk):
+    return f'memo-version:{name}:{pk}'
+
+
+def bump(name, pk):
+    """Retire the memoized name for pk everywhere."""
+    def retire():
+        caches['default'].set(_version_key(name, pk), time.time_ns(), None)
+    # Once now, for the rest of this transaction, and again at commit so that
+    # nothing read before the commit stays cached under the new version
+    retire()
+    transaction.on_commit(retire)
+
+
+def versions(*names):
+    """Current versions of (name, pk) pairs, starting one for any without."""
+    shared = caches['default']
+    keys = [_version_key(name, pk) for name, pk in names]
+    found = shared.get_many(keys)
+    for key in keys:
+        if key not in found:
+            found[key] = shared.get_or_set(key, time.time_ns, None)
+    return [found[key] for key in keys]
+
+
+def memoize(name, pk, compute):
+    """compute()'s value, memoized as name for pk unless it's None."""
+    if not settings.CACHE_SHARED:
+        return compute()
+    shared, local = caches['default'], caches['local']
+    version, = versions((name, pk))
+    key = f'memo:{name}:{pk}:{version}'
+    value = local.get(key)
+    if value is not None:
+        perf.record_cache(hits=1)
+        return value
+    value = shared.get(key)
+    perf.record_cache(hits=int(value is not None), misses=int(value is None))
+    if value is None:
+        # Not from a replica that may not have the write behind the version yet
+        with routers.primary():
+            value = compute()
+        if value is None:
+            return None
+        shared.set(key, value, settings.MEMO_TIMEOUT)
+    local.set(key, value, settings.MEMO_LOCAL_TIMEOUT)
+    return value
+
+
+def user(pk):
+    """User pk with their profile attached, or None if there's no such user."""
+    return memoize('user', pk, lambda: User.objects.select_related('profile').defer(
+        *(f'profile__{counter}' for counter in COUNTERS)).filter(pk=pk).first())
+
@@ -0,0 +1,169 @@
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import perf, routers
+
+logger = logging.getLogger('tweet.perf')
+
+
+class PerformanceMiddleware:
+    """
+    Times a sample of requests (PERF_SAMPLE_RATE) per view: wall, database
+    and template time, query and duplicate-query counts and cache hits. The
+    numbers go out as a Server-Timing header (PERF_SERVER_TIMING), one JSON
+    log line on the tweet.perf logger and the histograms behind /metrics.
+    Unsampled requests pass straight through. Works under WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        perf.instrument_templates()
+        perf.instrument_database()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        stats, token = perf.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            perf.stop(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        stats, token = perf.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            perf.stop(token)
+        return self.finish(request, response, stats)
+
+    def sampled(self):
+        rate = settings.PERF_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def finish(self, request, response, stats):
+        wall_time = time.perf_counter() - stats.started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else '<unresolved>'
+        perf.registry.record(view, stats, wall_time)
+        perf.registry.flush()
+
+        if settings.PERF_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'total;dur={wall_time * 1000:.1f}',
+                f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries, {stats.duplicate_queries} duplicate"',
+                f'tpl;dur={stats.template_time * 1000:.1f}',
+                f'cache;desc="{stats.cache_hits} hit, {stats.cache_misses} miss"',
+            ])
+        logger.info(json.dumps({
+            'view': view,
+            'method': request.method,
+            'status': response.status_code,
+            'wall_ms': round(wall_time * 1000, 2),
+            'db_ms': round(stats.db_time * 1000, 2),
+            'queries': stats.queries,
+            'duplicate_queries': stats.duplicate_queries,
+            'template_ms': round(stats.template_time * 1000, 2),
+            'cache_hits': stats.cache_hits,
+            'cache_misses': stats.cache_misses,
+        }))
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise, minus the thread hop under ASGI: its middleware is sync only,
+    which would make Django run every request below it on a thread. Static
+    hits are looked up in WhiteNoise's in-memory index and everything else
+    awaits the next handler directly.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            # Development: looks on disk
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class ReplicaMiddleware:
+    """
+    Lets a request read from the replicas (see tweet.routers), unless it's a
+    POST or the like, or comes from a visitor who wrote in the last
+    DATABASE_REPLICA_PIN_SECONDS: a request that writes sets a cookie keeping
+    its visitor on the primary until the replicas have caught up, so they see
+    their own tweet, like or follow on the next page.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not routers.in_use():
+            return self.get_response(request)
+        token = routers.begin(self.replicas_allowed(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.end(token)
+        return self.finish(response, wrote)
+
+    async def __acall__(self, request):
+        if not routers.in_use():
+            return await self.get_response(request)
+        token = routers.begin(self.replicas_allowed(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrote = routers.end(token)
+        return self.finish(response, wrote)
+
+    def replicas_allowed(self, request):
+        return request.method in ('GET', 'HEAD', 'OPTIONS') and settings.REPLICA_PIN_COOKIE not in request.COOKIES
+
+    def finish(self, response, wrote):
+        if wrote:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1', max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax', secure=settings.SESSION_COOKIE_SECURE)
+            # Not a page for shared caches any more
+            patch_cache_control(response, private=True)
+        return response
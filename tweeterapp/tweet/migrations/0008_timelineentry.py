@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet', '0007_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='tweet.profile')),
+                ('tweet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='tweet.tweet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['profile', '-created_at'], name='timeline_profile_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('profile', 'tweet'), name='unique_timeline_entry')],
+            },
+        ),
+    ]
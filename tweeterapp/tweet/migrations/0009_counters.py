@@ -0,0 +1,62 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, field):
+    counted = queryset.order_by().values(field).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(counted), 0)
+
+
+def populate_counters(apps, schema_editor):
+    Tweet = apps.get_model('tweet', 'Tweet')
+    Profile = apps.get_model('tweet', 'Profile')
+    Comment = apps.get_model('tweet', 'Comment')
+    follows = Profile.follows.through.objects
+    Tweet.objects.update(
+        likes_count=_count(Tweet.likes.through.objects.filter(tweet_id=OuterRef('pk')), 'tweet_id'),
+        comments_count=_count(Comment.objects.filter(tweet_id=OuterRef('pk')), 'tweet_id'),
+    )
+    Profile.objects.update(
+        followers_count=_count(follows.filter(to_profile_id=OuterRef('pk')), 'to_profile_id'),
+        following_count=_count(follows.filter(from_profile_id=OuterRef('pk')), 'from_profile_id'),
+        tweets_count=_count(Tweet.objects.filter(user_id=OuterRef('user_id')), 'user_id'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet', '0008_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='tweets_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tweet',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tweet',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def record_latest_senders(apps, schema_editor):
+    # Unread rows only know their latest actor; count them as seen
+    Notification = apps.get_model('tweet', 'Notification')
+    NotificationActor = apps.get_model('tweet', 'NotificationActor')
+    pending = Notification.objects.filter(is_read=False).values_list('id', 'sender_id')
+    batch = []
+    for notification_id, sender_id in pending.iterator(chunk_size=2000):
+        batch.append(NotificationActor(notification_id=notification_id, user_id=sender_id))
+        if len(batch) == 2000:
+            NotificationActor.objects.bulk_create(batch)
+            batch = []
+    NotificationActor.objects.bulk_create(batch)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet', '0019_liveevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actors', to='tweet.notification')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('notification', 'user'), name='unique_notification_actor')],
+            },
+        ),
+        migrations.RunPython(record_latest_senders, migrations.RunPython.noop),
+    ]
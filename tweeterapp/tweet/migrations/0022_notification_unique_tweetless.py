@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:40
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def read_duplicate_follows(apps, schema_editor):
+    # Concurrent first follows could each insert an unread row; keep the latest
+    Notification = apps.get_model('tweet', 'Notification')
+    pending = Notification.objects.filter(is_read=False, tweet__isnull=True)
+    duplicated = (pending.values('recipient_id', 'notification_type')
+                  .annotate(n=Count('id'), latest=Max('id')).filter(n__gt=1))
+    for row in duplicated.iterator():
+        pending.filter(recipient_id=row['recipient_id'], notification_type=row['notification_type'],
+                       id__lt=row['latest']).update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet', '0021_timeline_index_tweet'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(read_duplicate_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_read', False), ('tweet__isnull', True)), fields=('recipient', 'notification_type'), name='unique_unread_tweetless_notification'),
+        ),
+    ]
@@ -1,9 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models import F, Q
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.text import slugify
-import re
 
 # Create your models here.
 class Tag(models.Model):
@@ -17,47 +18,290 @@ class Tag(models.Model):
         self.slug = slugify(self.name)
         super().save(*args, **kwargs)
 
+class TagActivity(models.Model):
+    # Number of times a tag was used in tweets created during one hour bucket
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='activity')
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tag', 'bucket'], name='unique_tag_activity_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['bucket'], name='tag_activity_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.tag_id} @ {self.bucket:%Y-%m-%d %H:00}: {self.count}"
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    # Storage names of the resized copies, filled in by tweet.images
+    profile_picture_renditions = models.JSONField(default=dict, blank=True)
     bio = models.TextField(max_length=500, blank=True)
     follows = models.ManyToManyField("self", related_name="followed_by", symmetrical=False, blank=True)
+    # Denormalized counters, kept in step with F() updates (see `recount`)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    tweets_count = models.PositiveIntegerField(default=0)
+    # Bumped on every save; part of the cache key for this author's tweet cards
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-followers_count', 'id'], name='profile_followers_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} Profile'
 
+class FollowSuggestion(models.Model):
+    # Precomputed "who to follow" candidates, refreshed by tweet.recommendations
+    REASONS = (
+        ('mutual', 'Followed by people you follow'),
+        ('popular', 'Popular'),
+    )
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='suggestions')
+    candidate = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    reason = models.CharField(max_length=20, choices=REASONS)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'candidate'], name='unique_follow_suggestion'),
+        ]
+        indexes = [
+            models.Index(fields=['profile', '-score'], name='suggestion_profile_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.candidate} for {self.profile} ({self.score:g})"
+
+class Blob(models.Model):
+    # One stored file per distinct content, shared by every upload of it (see tweet.storage)
+    key = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+class Job(models.Model):
+    # A queued call to a tweet.jobs task, claimed and run by `run_workers`.
+    # Finished jobs are deleted; ones out of attempts stay as FAILED.
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class LiveEvent(models.Model):
+    # An event for the live streams (tweet.live.DatabaseBackend), read by
+    # every web process and pruned after LIVE_RETENTION. No recipient means
+    # it's for everyone.
+    name = models.CharField(max_length=20)
+    data = models.JSONField(default=dict)
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.name} #{self.pk}"
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
+    # A login only touches last_login; don't expire the user's cached cards
+    if update_fields == frozenset({'last_login'}):
+        return
     instance.profile.save()
 
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Profile)
+def forget_memoized_user(sender, instance, **kwargs):
+    from . import memo
+
+    memo.bump('user', instance.pk if sender is User else instance.user_id)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def record_people_write(sender, instance, update_fields=None, **kwargs):
+    from . import conditional, memo
+
+    if sender is User:
+        memo.bump('user-id', instance.username)
+    # No page shows last_login
+    if update_fields == frozenset({'last_login'}):
+        return
+    conditional.wrote(instance.pk if sender is User else instance.user_id, scope=conditional.PEOPLE)
+
+@receiver(m2m_changed, sender=Profile.follows.through)
+def forget_follow_edges(sender, instance, action, reverse, pk_set, **kwargs):
+    # interactions.follow/unfollow write the through table directly and retire
+    # the edges themselves; this covers profile.follows.add() and friends
+    from . import graph
+
+    if action == 'pre_clear':
+        # clear() reports no ids, so note them while they're still there
+        related = instance.followed_by if reverse else instance.follows
+        instance._cleared_follow_ids = set(related.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_follow_ids', set())
+    if action.startswith('post_'):
+        for pk in pk_set:
+            if reverse:
+                graph.edge_changed(pk, instance.pk)
+            else:
+                graph.edge_changed(instance.pk, pk)
+
+class TweetQuerySet(models.QuerySet):
+    def for_display(self):
+        # Everything a rendered tweet card reads from related rows, so a page
+        # of tweets costs one query however many authors it shows
+        return self.select_related('user__profile')
+
+class TweetManager(models.Manager.from_queryset(TweetQuerySet)):
+    def bulk_import(self, tweets, batch_size=500):
+        """
+        Insert many tweets with bulk_create and run the side effects save()
+        would (counters, search index, timelines, hashtags) once per batch
+        instead of once per row. Tweets that come with a created_at keep it.
+        """
+        from .conditional import wrote
+        from .hashtags import sync_tags
+        from .search import get_backend
+        from .timeline import fan_out_many
+
+        created = []
+        for start in range(0, len(tweets), batch_size):
+            dates = [tweet.created_at for tweet in tweets[start:start + batch_size]]
+            batch = self.bulk_create(tweets[start:start + batch_size])
+            if any(dates):
+                # auto_now_add stamped them all with the current time
+                for tweet, created_at in zip(batch, dates):
+                    tweet.created_at = created_at or tweet.created_at
+                self.bulk_update(batch, ['created_at'])
+            per_user = {}
+            for tweet in batch:
+                per_user[tweet.user_id] = per_user.get(tweet.user_id, 0) + 1
+            for user_id, n in per_user.items():
+                Profile.objects.filter(user_id=user_id).update(tweets_count=F('tweets_count') + n)
+            get_backend().index(batch)
+            fan_out_many(batch)
+            sync_tags(batch, created=True)
+            wrote(*per_user)
+            created.extend(batch)
+        return created
+
 class Tweet(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tweets')
     text = models.CharField(max_length=280)
     image = models.ImageField(upload_to='tweets/images/', blank=True, null=True)
-    likes = models.ManyToManyField(User, related_name='liked_tweets', blank=True)
+    # Storage names of the resized copies, filled in by tweet.images
+    image_renditions = models.JSONField(default=dict, blank=True)
+    likes = models.ManyToManyField(User, through='Like', related_name='liked_tweets', blank=True)
     tags = models.ManyToManyField(Tag, related_name='tweets', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+    # Denormalized counters, kept in step with F() updates (see `recount`)
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    objects = TweetManager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination: global feed and per-author listings
+            models.Index(fields=['-created_at', '-id'], name='tweet_created_id_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='tweet_user_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}: {self.text[:50]}"
 
     def total_likes(self):
-        return self.likes.count()
+        return self.likes_count
 
     def save(self, *args, **kwargs):
+        created = self._state.adding
         super().save(*args, **kwargs)
-        # Parse hashtags from text
-        hashtags = re.findall(r'#(\w+)', self.text)
-        for tag_name in hashtags:
-            tag, created = Tag.objects.get_or_create(name=tag_name, defaults={'slug': slugify(tag_name)})
-            self.tags.add(tag)
+        if created:
+            Profile.objects.filter(user_id=self.user_id).update(tweets_count=F('tweets_count') + 1)
+        # Search indexing, hashtags and the fan-out to followers' timelines
+        # run on a worker, off the request
+        from .tasks import tweet_saved
+        tweet_saved.enqueue(self.pk, created)
+
+class Like(models.Model):
+    # Explicit through table for Tweet.likes (same table as the old auto one)
+    # so the likes tab can page by when the like happened.
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'tweet_tweet_likes'
+        unique_together = [('tweet', 'user')]
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='like_user_created_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} likes {self.tweet_id}"
+
+class TimelineEntry(models.Model):
+    # Materialized home timeline: one row per (follower, tweet). created_at is
+    # copied from the tweet so a page is a range scan on (profile, created_at,
+    # tweet).
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='timeline_entries')
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'tweet'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['profile', '-created_at', '-tweet'], name='timeline_profile_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.profile} <- {self.tweet_id}"
 
 class Notification(models.Model):
     NOTIFICATION_TYPES = (
@@ -72,10 +316,52 @@ class Notification(models.Model):
     tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, null=True, blank=True)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bursts of the same event are coalesced into one unread row: sender is
+    # the latest actor, actor_count how many different people it stands for
+    # (see NotificationActor).
+    actor_count = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipient', 'notification_type', 'tweet'],
+                condition=Q(is_read=False),
+                name='unique_unread_notification',
+            ),
+            # NULLs never collide, so the one above doesn't cover follows
+            models.UniqueConstraint(
+                fields=['recipient', 'notification_type'],
+                condition=Q(is_read=False, tweet__isnull=True),
+                name='unique_unread_tweetless_notification',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['recipient', '-updated_at', '-id'], name='notification_recipient_idx'),
+            models.Index(fields=['recipient'], condition=Q(is_read=False), name='notification_unread_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender} {self.notification_type} {self.recipient}"
 
+    @property
+    def others_count(self):
+        return self.actor_count - 1
+
+class NotificationActor(models.Model):
+    # Who a notification stands for, so the same person liking, unliking and
+    # liking again counts once
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='actors')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'user'], name='unique_notification_actor'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.notification_id}"
+
 class Comment(models.Model):
     tweet = models.ForeignKey(Tweet, related_name='comments', on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -83,4 +369,135 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Comment by {self.user.username} on {self.tweet}"
\ No newline at end of file
+        return f"Comment by {self.user.username} on {self.tweet}"
+
+@receiver(post_save, sender=Comment)
+def increment_comments_count(sender, instance, created, **kwargs):
+    if created:
+        Tweet.objects.filter(pk=instance.tweet_id).update(comments_count=F('comments_count') + 1)
+
+@receiver(post_delete, sender=Comment)
+def decrement_comments_count(sender, instance, origin=None, **kwargs):
+    # Nothing to adjust when the tweet itself is going away
+    if isinstance(origin, Tweet) or getattr(origin, 'model', None) is Tweet:
+        return
+    Tweet.objects.filter(pk=instance.tweet_id, comments_count__gt=0).update(comments_count=F('comments_count') - 1)
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def record_comment_write(sender, instance, origin=None, **kwargs):
+    from .conditional import wrote
+
+    # The tweet's own delete records that
+    if isinstance(origin, Tweet) or getattr(origin, 'model', None) is Tweet:
+        return
+    wrote(instance.user_id, tweet_id=instance.tweet_id)
+
+@receiver(post_save, sender=Tweet)
+@receiver(post_delete, sender=Tweet)
+def record_tweet_write(sender, instance, **kwargs):
+    from .conditional import wrote
+    wrote(instance.user_id, tweet_id=instance.pk, author_id=instance.user_id)
+
+@receiver(post_save, sender=Tweet)
+def process_tweet_image(sender, instance, **kwargs):
+    from . import images
+    if images.needs_processing(instance, 'image'):
+        images.schedule(instance, 'image', 'tweet')
+
+@receiver(post_save, sender=Profile)
+def process_profile_picture(sender, instance, **kwargs):
+    from . import images
+    if images.needs_processing(instance, 'profile_picture'):
+        images.schedule(instance, 'profile_picture', 'avatar')
+
+# The image field of each model whose files are reference counted in storage
+MEDIA_FIELDS = {Tweet: 'image', Profile: 'profile_picture'}
+
+@receiver(post_init, sender=Tweet)
+@receiver(post_init, sender=Profile)
+def remember_stored_media(sender, instance, **kwargs):
+    # The name as loaded, so a save that replaces or clears it can release the
+    # old file. Read __dict__ so a deferred field isn't fetched just for this.
+    value = instance.__dict__.get(MEDIA_FIELDS[sender])
+    instance._stored_media = getattr(value, 'name', value)
+
+@receiver(pre_save, sender=Tweet)
+@receiver(pre_save, sender=Profile)
+def find_replaced_media(sender, instance, **kwargs):
+    field_name = MEDIA_FIELDS[sender]
+    field_file = getattr(instance, field_name)
+    instance._replaced_media = None
+    if instance.pk is None or not instance._stored_media:
+        return
+    if field_file and field_file._committed and field_file.name == instance._stored_media:
+        return
+    # Looks replaced or cleared. The loaded name may be stale (the image
+    # pipeline renames files with update()), so ask the database what goes.
+    instance._replaced_media = sender.objects.filter(pk=instance.pk).values_list(
+        field_name, f'{field_name}_renditions').first()
+
+@receiver(post_save, sender=Tweet)
+@receiver(post_save, sender=Profile)
+def release_replaced_media(sender, instance, **kwargs):
+    from . import images
+    field_name = MEDIA_FIELDS[sender]
+    new = getattr(instance, field_name).name
+    replaced, instance._replaced_media = instance._replaced_media, None
+    instance._stored_media = new
+    if not replaced or not replaced[0] or replaced[0] == new:
+        return
+    old, renditions = replaced
+    if new:
+        # The new image's processing releases the old renditions
+        renditions = None
+    else:
+        sender.objects.filter(pk=instance.pk).update(**{f'{field_name}_renditions': {}})
+        setattr(instance, f'{field_name}_renditions', {})
+    images.release(instance, field_name, old, renditions)
+
+@receiver(post_delete, sender=Tweet)
+@receiver(post_delete, sender=Profile)
+def release_deleted_media(sender, instance, **kwargs):
+    from . import images
+    field_name = MEDIA_FIELDS[sender]
+    images.release(instance, field_name, getattr(instance, field_name).name,
+                   getattr(instance, f'{field_name}_renditions'))
+
+@receiver(post_delete, sender=Tweet)
+def decrement_tweets_count(sender, instance, **kwargs):
+    Profile.objects.filter(user_id=instance.user_id, tweets_count__gt=0).update(tweets_count=F('tweets_count') - 1)
+
+@receiver(post_delete, sender=Tweet)
+def remove_from_search_index(sender, instance, **kwargs):
+    from .search import get_backend
+    get_backend().remove([instance.pk])
+
+@receiver(post_delete, sender=Tweet)
+def forget_tweet_cards(sender, instance, **kwargs):
+    from .cards import forget
+    forget(instance)
+
+@receiver(pre_delete, sender=Tweet)
+def retract_trending_uses(sender, instance, **kwargs):
+    # Its tag links cascade away with it
+    from . import trending
+
+    tag_ids = Tweet.tags.through.objects.filter(tweet_id=instance.pk).values_list('tag_id', flat=True)
+    trending.retract((tag_id, instance.created_at) for tag_id in tag_ids)
+
+@receiver(pre_delete, sender=User)
+def forget_deleted_follow_edges(sender, instance, **kwargs):
+    # The edges cascade without m2m signals too
+    from . import graph
+
+    edges = Profile.follows.through.objects.filter(Q(from_profile__user=instance) | Q(to_profile__user=instance))
+    for profile_id, target_id in edges.values_list('from_profile_id', 'to_profile_id'):
+        graph.edge_changed(profile_id, target_id)
+
+@receiver(pre_delete, sender=User)
+def release_user_counters(sender, instance, **kwargs):
+    # Likes and follow edges cascade without m2m signals, so settle them here
+    Tweet.objects.filter(likes=instance, likes_count__gt=0).update(likes_count=F('likes_count') - 1)
+    Profile.objects.filter(followed_by__user=instance, followers_count__gt=0).update(followers_count=F('followers_count') - 1)
+    Profile.objects.filter(follows__user=instance, following_count__gt=0).update(following_count=F('following_count') - 1)
@@ -0,0 +1,69 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import conditional, live
+from .models import Notification, NotificationActor
+
+
+def notify(recipient_id, sender_id, notification_type, tweet_id=None):
+    """
+    Record an event for recipient, folding it into their unread notification
+    of the same kind (and tweet) if there is one, so a burst of likes from N
+    people is one row with actor_count=N rather than N rows. Someone acting
+    again (liking, unliking, liking) moves the row up without counting twice.
+    """
+    if recipient_id == sender_id:
+        return
+    pending = Notification.objects.filter(
+        recipient_id=recipient_id, notification_type=notification_type, tweet_id=tweet_id, is_read=False,
+    )
+    notification_id = pending.values_list('pk', flat=True).first()
+    if notification_id is None:
+        try:
+            with transaction.atomic():
+                notification = Notification.objects.create(
+                    recipient_id=recipient_id, sender_id=sender_id,
+                    notification_type=notification_type, tweet_id=tweet_id,
+                )
+                NotificationActor.objects.create(notification=notification, user_id=sender_id)
+        except IntegrityError:
+            # Lost a race with a concurrent first event; fold into its row
+            notification_id = pending.values_list('pk', flat=True).first()
+    if notification_id is not None:
+        coalesce = {'sender_id': sender_id, 'updated_at': timezone.now()}
+        if _new_actor(notification_id, sender_id):
+            coalesce['actor_count'] = F('actor_count') + 1
+        Notification.objects.filter(pk=notification_id).update(**coalesce)
+    publish_badge(recipient_id)
+
+
+def _new_actor(notification_id, user_id):
+    # The unique constraint decides, so racing events can't both count
+    try:
+        with transaction.atomic():
+            NotificationActor.objects.create(notification_id=notification_id, user_id=user_id)
+    except IntegrityError:
+        return False
+    return True
+
+
+def unread_count(user):
+    return Notification.objects.filter(recipient=user, is_read=False).count()
+
+
+def publish_badge(user_id):
+    # The unread count for the user's open pages, and the ones they reload
+    live.publish('badge', {'unread': unread_count(user_id)}, user_id=user_id)
+    conditional.wrote(user_id, scope=None)
+
+
+def mark_read(user, ids=None):
+    """Mark all (or the given) unread notifications read in one UPDATE."""
+    notifications = Notification.objects.filter(recipient=user, is_read=False)
+    if ids is not None:
+        notifications = notifications.filter(pk__in=ids)
+    updated = notifications.update(is_read=True)
+    if updated:
+        publish_badge(user.pk)
+    return updated
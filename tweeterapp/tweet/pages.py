@@ -0,0 +1,158 @@
+# Query and context building for the hot pages and the like/follow
+# endpoints, shared by tweet.views and its tweet.async_views twins so a fix
+# lands in both. Paginators are built here and paged by the caller (get_page
+# or aget_page); the rest is plain sync code, which the async views run on
+# Django's sync thread.
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import F
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.utils.cache import patch_cache_control
+from django.utils.text import slugify
+
+from . import archive, graph, interactions, recommendations, tasks, trending
+from .forms import CommentForm
+from .models import Tweet
+from .pagination import CursorPaginator, RankedPaginator
+from .search import get_backend as get_search_backend
+
+
+def cards_context(page_obj, liked_ids, mentioned_users):
+    return {
+        'tweets': page_obj,
+        'page_obj': page_obj,
+        'liked_ids': liked_ids,
+        'mentioned_users': mentioned_users,
+    }
+
+
+def card_texts(page_obj, extra_texts=()):
+    """Texts whose @mentions the page's cards link."""
+    return [*extra_texts, *(t.text for t in page_obj)]
+
+
+def feed_paginator(params):
+    tweets = Tweet.objects.for_display()
+    query = params.get('q')
+    if not query:
+        return CursorPaginator(tweets, 10)
+    # If searching for a hashtag (e.g. #django), filter by the tag name
+    if query.startswith('#'):
+        return CursorPaginator(tweets.filter(tags__slug=slugify(query[1:])), 10)
+    # Ranked hits from the full-text index, best match first
+    ranked_ids = get_search_backend().search(query, settings.SEARCH_MAX_RESULTS)
+    return RankedPaginator(tweets, ranked_ids, 10)
+
+
+def feed_sidebar(user, params):
+    who_to_follow = []
+    if user.is_authenticated:
+        # Precomputed friends-of-friends and popular accounts
+        who_to_follow = recommendations.suggestions_for(user.profile)
+
+    # Get trending tags (top 5 by recent activity)
+    trend_window = params.get('trend', settings.TRENDING_DEFAULT_WINDOW)
+    return {
+        'who_to_follow': who_to_follow,
+        'trending_tags': trending.top_tags(trend_window),
+        'trend_window': trend_window,
+        'trend_windows': settings.TRENDING_WINDOWS,
+    }
+
+
+def profile_paginator(profile_user, tab):
+    if tab == 'likes':
+        # Most recently liked first, paged on the like rather than the tweet
+        tweets = Tweet.objects.filter(like__user=profile_user).for_display().annotate(
+            liked_at=F('like__created_at'), like_id=F('like__id'))
+        return CursorPaginator(tweets, 10, ordering=('-liked_at', '-like_id'))
+    return CursorPaginator(Tweet.objects.filter(user=profile_user).for_display(), 10)
+
+
+def profile_relationship(user, profile_user):
+    # Follow status, and who of the people the viewer follows follow them too
+    is_following, known_followers, known_count = False, [], 0
+    if user.is_authenticated and user != profile_user:
+        is_following, known_followers, known_count = graph.relationship(user.profile.pk, profile_user.profile.pk)
+    return {
+        'is_following': is_following,
+        'known_followers': known_followers,
+        'known_followers_others': known_count - len(known_followers),
+    }
+
+
+def detail_context(tweet, comments, liked_ids, mentioned_users):
+    return {
+        'tweet': tweet,
+        'comments': comments,
+        'form': CommentForm(),
+        'liked': tweet.pk in liked_ids,
+        'mentioned_users': mentioned_users,
+    }
+
+
+def toggle_follow(request, user, profile_to_toggle):
+    # PUT follows and DELETE unfollows, both idempotent; GET/POST toggle
+    is_xhr = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+    profile = user.profile
+    if profile.pk == profile_to_toggle.pk:
+        if request.method in ('PUT', 'DELETE'):
+            return JsonResponse({'error': "You cannot follow yourself."}, status=400)
+        messages.warning(request, "You cannot follow yourself.")
+        return redirect('profile', username=user.username)
+
+    if request.method == 'PUT':
+        is_following, changed = True, interactions.follow(profile.pk, profile_to_toggle.pk)
+    elif request.method == 'DELETE':
+        is_following, changed = False, interactions.unfollow(profile.pk, profile_to_toggle.pk)
+    elif interactions.unfollow(profile.pk, profile_to_toggle.pk):
+        is_following, changed = False, True
+    else:
+        is_following, changed = True, interactions.follow(profile.pk, profile_to_toggle.pk)
+
+    if changed:
+        profile_to_toggle.refresh_from_db(fields=['followers_count', 'following_count'])
+        tasks.follow_changed.enqueue(profile.pk, profile_to_toggle.pk)
+        if is_following:
+            tasks.notify.enqueue(profile_to_toggle.user_id, user.id, 'follow')
+        if not is_xhr and request.method in ('GET', 'POST'):
+            if is_following:
+                messages.success(request, f"You are now following {profile_to_toggle.user.username}.")
+            else:
+                messages.info(request, f"You have unfollowed {profile_to_toggle.user.username}.")
+
+    if is_xhr or request.method in ('PUT', 'DELETE'):
+        return JsonResponse({
+            'is_following': is_following,
+            'followers_count': profile_to_toggle.followers_count,
+            'following_count': profile_to_toggle.following_count
+        })
+    return redirect('profile', username=profile_to_toggle.user.username)
+
+
+def toggle_like(request, user, tweet):
+    # PUT likes and DELETE unlikes, both idempotent; GET/POST toggle
+    if request.method == 'PUT':
+        liked, (changed, count) = True, interactions.like(user.id, tweet.pk)
+    elif request.method == 'DELETE':
+        liked, (changed, count) = False, interactions.unlike(user.id, tweet.pk)
+    else:
+        changed, count = interactions.unlike(user.id, tweet.pk)
+        liked = not changed
+        if liked:
+            changed, count = interactions.like(user.id, tweet.pk)
+    if liked and changed:
+        tasks.notify.enqueue(tweet.user_id, user.id, 'like', tweet.pk)
+
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.method in ('PUT', 'DELETE'):
+        return JsonResponse({'liked': liked, 'count': count})
+    return redirect(request.META.get('HTTP_REFERER', 'tweet_list'))
+
+
+def export_response(user, lines):
+    # lines is archive.lines or, for ASGI, archive.alines
+    response = StreamingHttpResponse(lines(user), content_type=archive.CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{user.username}.ndjson"'
+    patch_cache_control(response, private=True, no_store=True)
+    return response
@@ -0,0 +1,219 @@
+import base64
+import binascii
+import heapq
+import json
+
+from django.db.models import Q
+
+
+class CursorPage:
+    """One page of a CursorPaginator; a drop-in for Page in templates."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset paginator: each page is a range scan that starts right after the
+    ordering key of the last row seen, so page N costs the same as page 1 and
+    no COUNT(*) is needed. The ordering must be unique, so always end it on
+    the primary key.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+
+    def key(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def encode_cursor(self, obj, direction):
+        values = self.key(obj)
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+        payload = json.dumps([direction, values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(payload)
+        except (TypeError, ValueError, binascii.Error):
+            return None
+        if direction not in ('n', 'p') or not isinstance(values, list) or len(values) != len(self.fields):
+            return None
+        return direction, values
+
+    def _seek(self, values, forward):
+        # (a, b) after (x, y) in the page order == a > x OR (a = x AND b > y),
+        # with > flipped to < for descending fields.
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            descending = field.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{f'{self.fields[i]}__{lookup}': values[i]})
+            for prior, value in zip(self.fields[:i], values):
+                term &= Q(**{prior: value})
+            condition |= term
+        return condition
+
+    def get_page(self, cursor=None):
+        """Return the page a cursor points at, falling back to the first page."""
+        decoded = self.decode_cursor(cursor) if cursor else None
+        page = self._page(list(self._rows(decoded)), decoded)
+        # A stale cursor past either end of the list restarts at the top
+        return self.get_page() if page is None else page
+
+    async def aget_page(self, cursor=None):
+        """get_page for async views."""
+        decoded = self.decode_cursor(cursor) if cursor else None
+        page = self._page([row async for row in self._rows(decoded)], decoded)
+        return await self.aget_page() if page is None else page
+
+    def _rows(self, decoded):
+        limit = self.per_page + 1
+        if decoded is None:
+            return self.queryset.order_by(*self.ordering)[:limit]
+        if decoded[0] == 'n':
+            return self.queryset.filter(self._seek(decoded[1], True)).order_by(*self.ordering)[:limit]
+        reverse = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+        return self.queryset.filter(self._seek(decoded[1], False)).order_by(*reverse)[:limit]
+
+    def _page(self, rows, decoded):
+        # None when a cursor led nowhere
+        if decoded is None:
+            has_next, has_previous = len(rows) > self.per_page, False
+            rows = rows[:self.per_page]
+        elif decoded[0] == 'n':
+            has_next, has_previous = len(rows) > self.per_page, True
+            rows = rows[:self.per_page]
+        else:
+            has_next, has_previous = True, len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+
+        if not rows:
+            return None if decoded else CursorPage([])
+        return CursorPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], 'n') if has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], 'p') if has_previous else None,
+        )
+
+
+class RankedPaginator(CursorPaginator):
+    """
+    Pages through an already-ranked list of ids (e.g. search hits). The cursor
+    is a position in that list and each page loads only its own rows.
+    """
+
+    def __init__(self, queryset, ranked_ids, per_page):
+        super().__init__(queryset, per_page, ordering=('position',))
+        self.ranked_ids = ranked_ids
+
+    def get_page(self, cursor=None):
+        start, page_ids = self._ids(cursor)
+        return self._ranked_page(self.queryset.in_bulk(page_ids), start, page_ids)
+
+    async def aget_page(self, cursor=None):
+        start, page_ids = self._ids(cursor)
+        return self._ranked_page(await self.queryset.ain_bulk(page_ids), start, page_ids)
+
+    def _ids(self, cursor):
+        decoded = self.decode_cursor(cursor) if cursor else None
+        start = 0
+        if decoded is not None and isinstance(decoded[1][0], int):
+            direction, (position,) = decoded
+            start = position + 1 if direction == 'n' else max(position - self.per_page, 0)
+        return start, self.ranked_ids[start:start + self.per_page]
+
+    def _ranked_page(self, rows, start, page_ids):
+        object_list = []
+        for position, pk in enumerate(page_ids, start):
+            if pk in rows:
+                rows[pk].position = position
+                object_list.append(rows[pk])
+        if not object_list:
+            return CursorPage([])
+        end = start + len(page_ids)
+        return CursorPage(
+            object_list,
+            next_cursor=self.encode_cursor(object_list[-1], 'n') if end < len(self.ranked_ids) else None,
+            previous_cursor=self.encode_cursor(object_list[0], 'p') if start > 0 else None,
+        )
+
+
+class MergedPaginator(CursorPaginator):
+    """
+    Keyset pages over several sources merged into one order, each read as its
+    own range scan. A source is a values_list queryset of its ordering's
+    fields, ending on the id, with the ordering: sources list the same rows
+    under the same keys (a row in two of them shows once). load(ids) returns
+    the page's objects by id. fallback(), if given, returns one more source
+    holding only rows past the end of the others; it is read for pages they
+    can't fill, and for previous pages, which may start inside it.
+    """
+
+    def __init__(self, sources, load, per_page, fallback=None):
+        orderings = {len(ordering) for _, ordering in sources}
+        if len(orderings) != 1:
+            raise ValueError("Merged sources need keys of the same length.")
+        super().__init__(None, per_page, ordering=sources[0][1])
+        self.sources = [CursorPaginator(queryset, per_page, ordering) for queryset, ordering in sources]
+        self.load = load
+        self.fallback = fallback
+
+    def key(self, row):
+        return list(row)
+
+    def get_page(self, cursor=None):
+        decoded = self.decode_cursor(cursor) if cursor else None
+        page = self._page(self._merged(decoded), decoded)
+        if page is None:
+            return self.get_page()
+        objects = self.load([row[-1] for row in page.object_list])
+        page.object_list = [objects[row[-1]] for row in page.object_list if row[-1] in objects]
+        return page
+
+    def _merged(self, decoded):
+        # Sources come in page order, or reversed for a previous page; the
+        # first field sets whether that order is descending
+        descending = self.ordering[0].startswith('-') == (decoded is None or decoded[0] == 'n')
+        merged = self._first(heapq.merge(*(source._rows(decoded) for source in self.sources), reverse=descending))
+        if self.fallback is not None and (len(merged) <= self.per_page or decoded and decoded[0] == 'p'):
+            queryset, ordering = self.fallback()
+            rows = CursorPaginator(queryset, self.per_page, ordering)._rows(decoded)
+            merged = self._first(heapq.merge(merged, rows, reverse=descending))
+        return merged
+
+    def _first(self, rows):
+        # The first per_page + 1 distinct rows
+        merged, seen = [], set()
+        for row in rows:
+            if row[-1] not in seen:
+                seen.add(row[-1])
+                merged.append(row)
+                if len(merged) > self.per_page:
+                    break
+        return merged
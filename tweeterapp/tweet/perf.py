@@ -0,0 +1,250 @@
+# Per-request performance stats and the process-wide metrics they feed.
+# Each worker keeps its own histograms and flushes them to a file per pid in
+# PERF_METRICS_DIR, so the metrics endpoint can sum them across workers.
+import contextvars
+import glob
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template
+
+# Upper bounds in seconds, Prometheus style
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+HISTOGRAMS = {
+    'request_duration_seconds': "Wall time per request.",
+    'db_duration_seconds': "Time spent in database queries per request.",
+    'template_duration_seconds': "Time spent rendering templates per request.",
+    'job_duration_seconds': "Run time per background job.",
+    'job_wait_seconds': "Time background jobs spent queued past their run time.",
+}
+COUNTERS = {
+    'requests_total': "Requests handled.",
+    'db_queries_total': "Database queries executed.",
+    'db_duplicate_queries_total': "Queries repeating SQL already run in the same request.",
+    'cache_hits_total': "Cache reads that found a value.",
+    'cache_misses_total': "Cache reads that found nothing.",
+    'jobs_succeeded_total': "Background jobs that ran to completion.",
+    'jobs_retried_total': "Background job attempts that failed and were requeued.",
+    'jobs_failed_total': "Background jobs that failed their last attempt.",
+}
+# Request metrics are labelled by view, job metrics by task
+JOB_METRICS = {'job_duration_seconds', 'job_wait_seconds', 'jobs_succeeded_total', 'jobs_retried_total', 'jobs_failed_total'}
+
+_current = contextvars.ContextVar('perf_request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        self.statements = Counter()
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def duplicate_queries(self):
+        return sum(n - 1 for n in self.statements.values() if n > 1)
+
+    def __call__(self, execute, sql, params, many, context):
+        # Called by _record_query, or usable as a connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+
+def start():
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def record_cache(hits=0, misses=0):
+    """Count cache reads against the current request, if it is sampled."""
+    stats = _current.get()
+    if stats is not None:
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def _instrument_connection(sender=None, connection=None, **kwargs):
+    # At the front, so execute_wrapper() blocks popping their own wrapper
+    # can't pop this one
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def instrument_database():
+    """
+    Count queries on every connection against the request being timed. The
+    request is found through a context variable rather than wrappers pushed
+    per request, because async views run their queries on connections that
+    belong to other threads.
+    """
+    connection_created.connect(_instrument_connection, dispatch_uid='tweet.perf')
+    for connection in connections.all():
+        _instrument_connection(connection=connection)
+
+
+_template_render = Template.render
+
+
+def _timed_render(self, context=None, request=None):
+    stats = _current.get()
+    if stats is None:
+        return _template_render(self, context, request)
+    # Only the outermost render counts; includes and nested
+    # render_to_string calls are part of its time
+    stats.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _template_render(self, context, request)
+    finally:
+        stats.template_depth -= 1
+        if not stats.template_depth:
+            stats.template_time += time.perf_counter() - started
+
+
+def instrument_templates():
+    Template.render = _timed_render
+
+
+class Registry:
+    """This process's histograms and counters, keyed on (name, view or task)."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.histograms = {}
+        self.counters = Counter()
+        self.last_flush = 0.0
+
+    def observe(self, name, view, value):
+        key = (name, view)
+        with self.lock:
+            values = self.histograms.setdefault(key, [0] * (len(BUCKETS) + 2))
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def inc(self, name, view, amount=1):
+        if amount:
+            with self.lock:
+                self.counters[(name, view)] += amount
+
+    def record(self, view, stats, wall_time):
+        self.observe('request_duration_seconds', view, wall_time)
+        self.observe('db_duration_seconds', view, stats.db_time)
+        self.observe('template_duration_seconds', view, stats.template_time)
+        self.inc('requests_total', view)
+        self.inc('db_queries_total', view, stats.queries)
+        self.inc('db_duplicate_queries_total', view, stats.duplicate_queries)
+        self.inc('cache_hits_total', view, stats.cache_hits)
+        self.inc('cache_misses_total', view, stats.cache_misses)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'histograms': [[name, view, list(values)] for (name, view), values in self.histograms.items()],
+                'counters': [[name, view, value] for (name, view), value in self.counters.items()],
+            }
+
+    def flush(self, force=False):
+        """Write this worker's totals to PERF_METRICS_DIR, at most every PERF_FLUSH_INTERVAL."""
+        directory = settings.PERF_METRICS_DIR
+        now = time.monotonic()
+        if not directory or (not force and now - self.last_flush < settings.PERF_FLUSH_INTERVAL):
+            return
+        self.last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        # Write then rename so a scrape never reads half a file
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, os.path.join(directory, f'perf_{os.getpid()}.json'))
+
+
+registry = Registry()
+
+
+def collect():
+    """Totals across every worker that has flushed, plus this process's live numbers."""
+    snapshots = []
+    own = f'perf_{os.getpid()}.json'
+    if settings.PERF_METRICS_DIR:
+        for path in glob.glob(os.path.join(settings.PERF_METRICS_DIR, 'perf_*.json')):
+            if os.path.basename(path) == own:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    snapshots.append(registry.snapshot())
+
+    histograms = {}
+    counters = Counter()
+    for snapshot in snapshots:
+        for name, view, values in snapshot['histograms']:
+            total = histograms.setdefault((name, view), [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+        for name, view, value in snapshot['counters']:
+            counters[(name, view)] += value
+    return histograms, counters
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_name(metric):
+    return 'task' if metric in JOB_METRICS else 'view'
+
+
+def render_prometheus():
+    """The collected metrics in the Prometheus text exposition format."""
+    histograms, counters = collect()
+    prefix = settings.PERF_METRICS_PREFIX
+    lines = []
+    for name, help_text in HISTOGRAMS.items():
+        lines += [f'# HELP {prefix}_{name} {help_text}', f'# TYPE {prefix}_{name} histogram']
+        for (metric, view), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            labels = f'{_label_name(name)}="{_label(view)}"'
+            for bound, count in zip(BUCKETS, values):
+                lines.append(f'{prefix}_{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{prefix}_{name}_bucket{{{labels},le="+Inf"}} {values[-1]}')
+            lines.append(f'{prefix}_{name}_sum{{{labels}}} {values[-2]:.6f}')
+            lines.append(f'{prefix}_{name}_count{{{labels}}} {values[-1]}')
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP {prefix}_{name} {help_text}', f'# TYPE {prefix}_{name} counter']
+        for (metric, view), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{prefix}_{name}{{{_label_name(name)}="{_label(view)}"}} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,84 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import conditional
+from .models import FollowSuggestion, Profile
+
+
+def score_candidates(profile_id, following, follows_of, popular, limit):
+    """
+    Rank accounts for profile_id to follow. Friends-of-friends score one point
+    per followed account that follows them; popular accounts fill the rest of
+    the list with a score below 1 so they never outrank a mutual connection.
+    Pure function over ids so it can be scored offline against a graph.
+    """
+    excluded = set(following) | {profile_id}
+    mutual = Counter()
+    for friend_id in following:
+        for candidate_id in follows_of.get(friend_id, ()):
+            if candidate_id not in excluded:
+                mutual[candidate_id] += 1
+
+    ranked = [(candidate_id, float(n), 'mutual') for candidate_id, n in mutual.most_common(limit)]
+    seen = excluded | mutual.keys()
+    top_followers = max((followers for _, followers in popular), default=0) + 1
+    for candidate_id, followers in popular:
+        if len(ranked) >= limit:
+            break
+        if candidate_id not in seen:
+            ranked.append((candidate_id, followers / top_followers, 'popular'))
+            seen.add(candidate_id)
+    return ranked
+
+
+def popular_profiles():
+    """(profile_id, followers_count) for the most followed accounts."""
+    return list(
+        Profile.objects.order_by('-followers_count', 'id')
+        .values_list('id', 'followers_count')[:settings.SUGGESTIONS_POPULAR_POOL]
+    )
+
+
+def refresh(profile):
+    """Recompute and store profile's candidates from its two-hop follow graph."""
+    edges = Profile.follows.through.objects
+    following = set(edges.filter(from_profile_id=profile.pk).values_list('to_profile_id', flat=True))
+    follows_of = {}
+    for friend_id, candidate_id in edges.filter(from_profile_id__in=following).values_list('from_profile_id', 'to_profile_id'):
+        follows_of.setdefault(friend_id, []).append(candidate_id)
+
+    ranked = score_candidates(profile.pk, following, follows_of, popular_profiles(), settings.SUGGESTIONS_PER_PROFILE)
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(profile=profile).delete()
+        FollowSuggestion.objects.bulk_create([
+            FollowSuggestion(profile=profile, candidate_id=candidate_id, score=score, reason=reason)
+            for candidate_id, score, reason in ranked
+        ])
+    conditional.wrote(profile.user_id, scope=None)
+    return ranked
+
+
+def suggestions_for(profile, limit=3):
+    """
+    Top stored candidates for profile. Until a worker has computed them, the
+    most followed accounts profile doesn't follow yet: a page view doesn't write.
+    """
+    suggestions = list(
+        FollowSuggestion.objects.filter(profile=profile)
+        .select_related('candidate__user')
+        .order_by('-score', 'candidate_id')[:limit]
+    )
+    if suggestions:
+        return [suggestion.candidate for suggestion in suggestions]
+    from .tasks import refresh_suggestions
+
+    # Once per profile while the job waits for a worker
+    if cache.add(f'suggestions-queued:{profile.pk}', True, settings.SUGGESTIONS_QUEUED_TIMEOUT):
+        refresh_suggestions.enqueue(profile.pk)
+    return list(
+        Profile.objects.exclude(pk=profile.pk).exclude(followed_by=profile)
+        .select_related('user').order_by('-followers_count', 'id')[:limit]
+    )
@@ -0,0 +1,82 @@
+# Read replicas (DATABASE_REPLICAS). While ReplicaMiddleware lets a request
+# use them, its reads go to a random replica. Everything else goes to the
+# primary, 'default':
+#   - writes;
+#   - reads after the request's first write, or inside a transaction;
+#   - requests from visitors who wrote in the last few seconds;
+#   - all work outside requests: commands, job workers and the live stream.
+# Memoized values are always computed from the primary (see tweet.memo),
+# because a copy read from a lagging replica would stay cached under the new
+# version.
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class _Reads:
+    def __init__(self, replicas):
+        self.replicas = replicas
+        self.wrote = False
+
+
+# Shared by the request's threads: sync_to_async copies the context, not the object
+_reads = ContextVar('replica_reads', default=None)
+
+
+def begin(replicas=True):
+    """Start routing this request's reads; returns a token for end()."""
+    return _reads.set(_Reads(replicas))
+
+
+def end(token):
+    """Stop routing the request's reads; returns whether it wrote."""
+    reads = _reads.get()
+    _reads.reset(token)
+    return reads.wrote
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside the block."""
+    token = _reads.set(None)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def in_use():
+    return bool(settings.DATABASE_REPLICAS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        reads = _reads.get()
+        if reads is None or not reads.replicas or reads.wrote or not settings.DATABASE_REPLICAS:
+            return None
+        # A transaction must see its own uncommitted rows
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        reads = _reads.get()
+        if reads is not None:
+            reads.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the primary's rows
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
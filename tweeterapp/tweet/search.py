@@ -0,0 +1,146 @@
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from .models import Tweet
+
+WORD_RE = re.compile(r'\w+')
+
+
+class BaseSearchBackend:
+    """
+    Keeps a full-text index of tweet text in step with the tweet table and
+    answers ranked queries from it. Subclasses own the storage.
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+        self.connection = connections[using]
+
+    def terms(self, query):
+        return WORD_RE.findall(query.lower())
+
+    def index(self, tweets):
+        raise NotImplementedError
+
+    def remove(self, tweet_ids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def search(self, query, limit):
+        """Return up to `limit` matching tweet ids, best match first."""
+        raise NotImplementedError
+
+    def rebuild(self, batch_size=1000):
+        self.clear()
+        indexed = 0
+        batch = []
+        for tweet in Tweet.objects.using(self.using).only('id', 'text').iterator(chunk_size=batch_size):
+            batch.append(tweet)
+            if len(batch) == batch_size:
+                self.index(batch)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            self.index(batch)
+            indexed += len(batch)
+        return indexed
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    # FTS5 virtual table keyed on rowid = tweet id, ranked by bm25
+    def index(self, tweets):
+        rows = [(tweet.pk, tweet.text) for tweet in tweets]
+        with self.connection.cursor() as cursor:
+            cursor.executemany('DELETE FROM tweet_search WHERE rowid = %s', [(pk,) for pk, _ in rows])
+            cursor.executemany('INSERT INTO tweet_search (rowid, text) VALUES (%s, %s)', rows)
+
+    def remove(self, tweet_ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany('DELETE FROM tweet_search WHERE rowid = %s', [(pk,) for pk in tweet_ids])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM tweet_search')
+
+    def search(self, query, limit):
+        terms = self.terms(query)
+        if not terms:
+            return []
+        # Every term must match; the last one as a prefix for type-ahead
+        match = ' '.join(f'"{term}"' for term in terms) + '*'
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM tweet_search WHERE tweet_search MATCH %s ORDER BY rank, rowid DESC LIMIT %s',
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    # tsvector column in a side table with a GIN index, ranked by ts_rank
+    def index(self, tweets):
+        rows = [(tweet.pk, tweet.text) for tweet in tweets]
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO tweet_search (tweet_id, document) VALUES (%s, to_tsvector('simple', %s)) "
+                "ON CONFLICT (tweet_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+    def remove(self, tweet_ids):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM tweet_search WHERE tweet_id = ANY(%s)', [list(tweet_ids)])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('TRUNCATE tweet_search')
+
+    def search(self, query, limit):
+        terms = self.terms(query)
+        if not terms:
+            return []
+        tsquery = ' & '.join(terms[:-1] + [f'{terms[-1]}:*'])
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tweet_id FROM tweet_search, to_tsquery('simple', %s) query "
+                "WHERE document @@ query ORDER BY ts_rank(document, query) DESC, tweet_id DESC LIMIT %s",
+                [tsquery, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    # No index: substring scan, newest first. For databases without FTS.
+    def index(self, tweets):
+        pass
+
+    def remove(self, tweet_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def rebuild(self, batch_size=1000):
+        return 0
+
+    def search(self, query, limit):
+        tweets = Tweet.objects.using(self.using).filter(text__icontains=query.strip())
+        return list(tweets.order_by('-created_at', '-id').values_list('id', flat=True)[:limit])
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using='default'):
+    """The search backend for a database: SEARCH_BACKEND, else picked by vendor."""
+    if settings.SEARCH_BACKEND:
+        return import_string(settings.SEARCH_BACKEND)(using)
+    return BACKENDS.get(connections[using].vendor, BasicSearchBackend)(using)
@@ -0,0 +1,115 @@
+import hashlib
+import os
+
+from django.core.files.storage import Storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+BLOB_PREFIX = 'blobs/'
+# A blob's name changes whenever its content does, so it can be cached for good
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def blob_key(digest, name):
+    extension = os.path.splitext(name)[1].lower()
+    return f'{BLOB_PREFIX}{digest[:2]}/{digest}{extension}'
+
+
+@deconstructible
+class ContentAddressedStorage(Storage):
+    """
+    Stores every distinct file once, under the SHA-256 of its content, in the
+    storage named by `backend`. Saving bytes that are already stored only
+    bumps the blob's reference count; delete() drops one reference and only
+    removes the file with the last one. Names saved before this storage was
+    in place pass straight through to the backend.
+    """
+
+    def __init__(self, backend='django.core.files.storage.FileSystemStorage', options=None):
+        self.backend = backend
+        self.options = options or {}
+
+    @cached_property
+    def inner(self):
+        return import_string(self.backend)(**self.options)
+
+    def get_available_name(self, name, max_length=None):
+        # The content picks the final name; no need to ask the backend what's taken
+        return name
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        key = blob_key(digest.hexdigest(), name)
+
+        existing = self._acquire(key)
+        if existing is not None:
+            return existing
+        stored = self.inner.save(key, content)
+        try:
+            with transaction.atomic():
+                Blob.objects.create(key=key, name=stored, size=content.size, refcount=1)
+        except IntegrityError:
+            # Someone stored the same bytes first; keep theirs
+            existing = self._acquire(key)
+            if existing != stored:
+                self.inner.delete(stored)
+            if existing is None:
+                raise
+            return existing
+        return stored
+
+    def _acquire(self, key):
+        from .models import Blob
+
+        with transaction.atomic():
+            if Blob.objects.filter(key=key).update(refcount=F('refcount') + 1):
+                return Blob.objects.filter(key=key).values_list('name', flat=True).get()
+        return None
+
+    def delete(self, name):
+        from .models import Blob
+
+        if not name:
+            return
+        with transaction.atomic():
+            if not Blob.objects.filter(name=name, refcount__gt=0).update(refcount=F('refcount') - 1):
+                if not Blob.objects.filter(name=name).exists():
+                    self.inner.delete(name)
+                return
+            released = Blob.objects.filter(name=name, refcount=0).delete()[0]
+        if released:
+            self.inner.delete(name)
+
+    def _open(self, name, mode='rb'):
+        return self.inner.open(name, mode)
+
+    def exists(self, name):
+        return self.inner.exists(name)
+
+    def url(self, name):
+        return self.inner.url(name)
+
+    def path(self, name):
+        return self.inner.path(name)
+
+    def size(self, name):
+        return self.inner.size(name)
+
+    def listdir(self, path):
+        return self.inner.listdir(path)
+
+    def get_accessed_time(self, name):
+        return self.inner.get_accessed_time(name)
+
+    def get_created_time(self, name):
+        return self.inner.get_created_time(name)
+
+    def get_modified_time(self, name):
+        return self.inner.get_modified_time(name)
@@ -0,0 +1,59 @@
+# Background jobs for the side effects of writes (see tweet.jobs). Each takes
+# ids rather than instances and reloads what it needs, since it may run well
+# after, and in another process from, the request that queued it.
+from django.apps import apps
+
+from . import images, live, notifications, recommendations, timeline
+from .hashtags import HASHTAG_RE, sync_tags
+from .jobs import task
+from .models import Profile, Tweet
+from .search import get_backend
+
+
+@task
+def tweet_saved(tweet_id, created):
+    """Index a saved tweet, sync its hashtags and, if new, fan it out."""
+    tweet = Tweet.objects.filter(pk=tweet_id).first()
+    if tweet is None:
+        return
+    get_backend().index([tweet])
+    if created:
+        timeline.fan_out(tweet)
+        live.publish('tweet', {'id': tweet.pk})
+    if not created or HASHTAG_RE.search(tweet.text):
+        sync_tags([tweet], created=created)
+
+
+@task
+def notify(recipient_id, sender_id, notification_type, tweet_id=None):
+    notifications.notify(recipient_id, sender_id, notification_type, tweet_id)
+
+
+@task
+def follow_changed(profile_id, target_id):
+    """Bring profile's home timeline and suggestions in line with a follow or unfollow."""
+    profiles = Profile.objects.in_bulk([profile_id, target_id])
+    if len(profiles) < 2:
+        return
+    profile, target = profiles[profile_id], profiles[target_id]
+    # Go by the edge as it is now, not as it was when queued, so a follow
+    # and a quick unfollow settle right whichever job runs last
+    if profile.follows.filter(pk=target_id).exists():
+        timeline.backfill(profile, target)
+    else:
+        timeline.prune(profile, target)
+    recommendations.refresh(profile)
+
+
+@task
+def refresh_suggestions(profile_id):
+    profile = Profile.objects.filter(pk=profile_id).first()
+    if profile is not None:
+        recommendations.refresh(profile)
+
+
+@task
+def process_image(model_label, pk, field_name, kind):
+    instance = apps.get_model(model_label).objects.filter(pk=pk).first()
+    if instance is not None:
+        images.process(instance, field_name, kind)
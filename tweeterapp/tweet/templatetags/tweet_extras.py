@@ -1,36 +1,45 @@
 from django import template
-from django.utils.html import escape
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
-from django.urls import reverse
-import re
+
+from .. import cards, images, linkify
 
 register = template.Library()
 
 @register.filter
-def linkify_tweet(value):
-    # Escape the content first to prevent XSS
-    value = escape(value)
-    
-    # Linkify hashtags: #tag -> search link
-    def replace_hashtag(match):
-        hashtag = match.group(0) # e.g., #django
-        tag_name = hashtag[1:]   # e.g., django
-        # URL encode the # as %23 so it's treated as a query param, not an anchor
-        url = reverse('tweet_list') + f'?q=%23{tag_name}'
-        return f'<a href="{url}" class="text-blue-500 hover:underline">{hashtag}</a>'
+def linkify_tweet(value, known_users=None):
+    # Escapes the text, links hashtags and mentions of existing users.
+    # Pass the page's `mentioned_users` to skip a per-tweet lookup.
+    return mark_safe(linkify.render(value, known_users))
 
-    value = re.sub(r'#\w+', replace_hashtag, value)
-    
-    # Linkify mentions: @user -> profile link
-    def replace_mention(match):
-        mention = match.group(0) # e.g., @devang
-        username = mention[1:]   # e.g., devang
-        try:
-            url = reverse('profile', args=[username])
-            return f'<a href="{url}" class="text-blue-500 hover:underline">{mention}</a>'
-        except:
-            return mention
+@register.simple_tag(takes_context=True)
+def tweet_cards(context, tweets, variant):
+    # Cached per-tweet cards with this viewer's like state and owner links
+    return cards.render_cards(
+        tweets, variant, context['user'],
+        liked=context.get('liked_ids'),
+        mentioned_users=context.get('mentioned_users'),
+    )
 
-    value = re.sub(r'@\w+', replace_mention, value)
-    
-    return mark_safe(value)
\ No newline at end of file
+@register.simple_tag
+def picture(instance, field_name, sizes, **attrs):
+    # <picture> with AVIF/WebP srcsets from tweet.images; the original is the fallback
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        return ''
+    renditions = getattr(instance, f'{field_name}_renditions') or {}
+    sources = []
+    for fmt in images.FORMATS:
+        by_width = renditions.get(fmt)
+        if by_width:
+            srcset = ', '.join(
+                f'{field_file.storage.url(name)} {width}w'
+                for width, name in sorted(by_width.items(), key=lambda item: int(item[0]))
+            )
+            sources.append(format_html('<source type="image/{}" srcset="{}" sizes="{}">', fmt, srcset, sizes))
+    return format_html(
+        '<picture style="display: contents">{}<img src="{}"{}></picture>',
+        mark_safe(''.join(sources)),
+        field_file.url,
+        format_html_join('', ' {}="{}"', attrs.items()),
+    )
@@ -0,0 +1,128 @@
+from django.conf import settings
+from django.db.models import Q
+from .models import Profile, TimelineEntry, Tweet
+from .pagination import MergedPaginator
+
+
+def fan_out(tweet):
+    """Push a freshly created tweet into its author's and followers' inboxes."""
+    fan_out_many([tweet])
+
+
+def fan_out_many(tweets):
+    """fan_out for a batch of tweets, reading each author's followers once."""
+    user_ids = {tweet.user_id for tweet in tweets}
+    authors = {
+        user_id: (profile_id, followers_count)
+        for profile_id, user_id, followers_count
+        in Profile.objects.filter(user_id__in=user_ids).values_list('id', 'user_id', 'followers_count')
+    }
+    # Authors above the fan-out limit are merged in at read time instead
+    small_authors = [
+        profile_id for profile_id, followers_count in authors.values()
+        if followers_count <= settings.TIMELINE_FANOUT_LIMIT
+    ]
+    followers = {}
+    edges = Profile.follows.through.objects.filter(to_profile_id__in=small_authors)
+    for follower_id, author_id in edges.values_list('from_profile_id', 'to_profile_id'):
+        followers.setdefault(author_id, []).append(follower_id)
+
+    entries = []
+    for tweet in tweets:
+        if tweet.user_id not in authors:
+            continue
+        author_id = authors[tweet.user_id][0]
+        entries.extend(
+            TimelineEntry(profile_id=pid, tweet=tweet, created_at=tweet.created_at)
+            for pid in [author_id, *followers.get(author_id, [])]
+        )
+    TimelineEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+
+def backfill(profile, author):
+    """Copy the author's most recent tweets into profile's inbox after a follow."""
+    if author.followers_count > settings.TIMELINE_FANOUT_LIMIT:
+        return
+    tweets = (
+        Tweet.objects.filter(user_id=author.user_id)
+        .order_by('-created_at')
+        .values_list('id', 'created_at')[:settings.TIMELINE_BACKFILL_SIZE]
+    )
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(profile=profile, tweet_id=tweet_id, created_at=created_at)
+         for tweet_id, created_at in tweets],
+        ignore_conflicts=True,
+    )
+    trim([profile.pk])
+
+
+def trim(profile_ids):
+    """
+    Cut each profile's inbox back to its TIMELINE_SIZE newest entries; older
+    tweets are read from the follow graph instead (see home_timeline).
+    Returns the number of entries dropped.
+    """
+    dropped = 0
+    for profile_id in profile_ids:
+        inbox = TimelineEntry.objects.filter(profile_id=profile_id)
+        newest_dropped = (
+            inbox.order_by('-created_at', '-tweet_id')
+            .values_list('created_at', 'tweet_id')[settings.TIMELINE_SIZE:settings.TIMELINE_SIZE + 1]
+        )
+        for created_at, tweet_id in newest_dropped:
+            dropped += inbox.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, tweet_id__lte=tweet_id)
+            ).delete()[0]
+    return dropped
+
+
+def prune(profile, author):
+    """Drop the author's tweets from profile's inbox after an unfollow."""
+    TimelineEntry.objects.filter(profile=profile, tweet__user_id=author.user_id).delete()
+
+
+def rebuild(profile):
+    """Recompute a profile's inbox from scratch from the current follow graph."""
+    TimelineEntry.objects.filter(profile=profile).delete()
+    author_ids = [profile.user_id, *profile.follows.values_list('user_id', flat=True)]
+    tweets = (
+        Tweet.objects.filter(user_id__in=author_ids)
+        .order_by('-created_at')
+        .values_list('id', 'created_at')[:settings.TIMELINE_SIZE]
+    )
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(profile=profile, tweet_id=tweet_id, created_at=created_at)
+         for tweet_id, created_at in tweets],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def home_timeline(profile, per_page):
+    """
+    Paginator for profile's following feed: a range scan of their inbox
+    merged with one over the tweets of followed authors too big to fan out
+    on write. Past the inbox's oldest entry, the rest of the fanned-out
+    authors' tweets are read from the follow graph.
+    """
+    inbox = TimelineEntry.objects.filter(profile=profile).values_list('created_at', 'tweet_id')
+    sources = [(inbox, ('-created_at', '-tweet_id'))]
+    big_authors = list(
+        profile.follows.filter(followers_count__gt=settings.TIMELINE_FANOUT_LIMIT)
+        .values_list('user_id', flat=True)
+    )
+    if big_authors:
+        sources.append((
+            Tweet.objects.filter(user_id__in=big_authors).values_list('created_at', 'id'),
+            ('-created_at', '-id'),
+        ))
+
+    def below_inbox():
+        fanned_out = profile.follows.filter(followers_count__lte=settings.TIMELINE_FANOUT_LIMIT)
+        tweets = Tweet.objects.filter(Q(user_id=profile.user_id) | Q(user_id__in=fanned_out.values('user_id')))
+        oldest = inbox.order_by('created_at', 'tweet_id').first()
+        if oldest is not None:
+            tweets = tweets.filter(Q(created_at__lt=oldest[0]) | Q(created_at=oldest[0], id__lt=oldest[1]))
+        return tweets.values_list('created_at', 'id'), ('-created_at', '-id')
+
+    return MergedPaginator(sources, Tweet.objects.for_display().in_bulk, per_page, fallback=below_inbox)
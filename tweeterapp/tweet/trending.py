@@ -0,0 +1,93 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import perf
+from .models import Tag, TagActivity
+
+
+def bucket_for(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _counts(uses):
+    counts = defaultdict(int)
+    for tag_id, created_at in uses:
+        counts[(tag_id, bucket_for(created_at))] += 1
+    return counts
+
+
+def _update(counts, change):
+    # One UPDATE per distinct (bucket, n) group, which is usually just one
+    groups = defaultdict(list)
+    for (tag_id, bucket), n in counts.items():
+        groups[(bucket, n)].append(tag_id)
+    for (bucket, n), tag_ids in groups.items():
+        TagActivity.objects.filter(bucket=bucket, tag_id__in=tag_ids).update(count=change(n))
+
+
+def record(uses):
+    """
+    Count tag uses, given as (tag_id, tweet created_at) pairs, into their
+    hourly buckets: one insert for missing buckets, then one UPDATE per
+    distinct (bucket, increment) group, which is usually just one.
+    """
+    counts = _counts(uses)
+    if not counts:
+        return
+    TagActivity.objects.bulk_create(
+        [TagActivity(tag_id=tag_id, bucket=bucket) for tag_id, bucket in counts],
+        ignore_conflicts=True,
+    )
+    _update(counts, lambda n: F('count') + n)
+
+
+def retract(uses):
+    """Take back tag uses edited out of their tweets or deleted with them."""
+    _update(_counts(uses), lambda n: Greatest(F('count') - n, 0))
+
+
+def _score(window):
+    hours = settings.TRENDING_WINDOWS[window]
+    now = timezone.now()
+    half_life = max(hours / 4, 1)
+    scores = defaultdict(float)
+    totals = defaultdict(int)
+    rows = TagActivity.objects.filter(bucket__gt=bucket_for(now) - timedelta(hours=hours), count__gt=0)
+    for tag_id, bucket, count in rows.values_list('tag_id', 'bucket', 'count'):
+        age = (now - bucket).total_seconds() / 3600
+        scores[tag_id] += count * 0.5 ** (age / half_life)
+        totals[tag_id] += count
+    return scores, totals
+
+
+def _cache_key(window):
+    return f'trending:{window}'
+
+
+def top_tags(window=None, limit=5):
+    """The most active tags over a window ('1h', '24h', '7d'), served from cache."""
+    window = window if window in settings.TRENDING_WINDOWS else settings.TRENDING_DEFAULT_WINDOW
+    tags = cache.get(_cache_key(window))
+    perf.record_cache(hits=int(tags is not None), misses=int(tags is None))
+    if tags is None:
+        scores, totals = _score(window)
+        best = sorted(scores, key=lambda tag_id: (-scores[tag_id], tag_id))[:settings.TRENDING_TOP_K]
+        by_id = Tag.objects.in_bulk(best)
+        tags = []
+        for tag_id in best:
+            tag = by_id[tag_id]
+            tag.num_tweets = totals[tag_id]
+            tag.score = scores[tag_id]
+            tags.append(tag)
+        cache.set(_cache_key(window), tags, settings.TRENDING_CACHE_TIMEOUT)
+    return tags[:limit]
+
+
+def clear_cache():
+    cache.delete_many([_cache_key(window) for window in settings.TRENDING_WINDOWS])
@@ -1,19 +1,30 @@
 
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# The ASGI app serves the async variants of the hot paths (see tweet.async_views)
+hot = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('', views.tweet_list, name='tweet_list'),
+    path('', hot.tweet_list, name='tweet_list'),
     path('home/', views.home, name='home'),
+    path('following/', views.home_timeline, name='home_timeline'),
     path('my-tweets/', views.my_tweets, name='my_tweets'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
-    path('profile/follow/<int:pk>/', views.follow_toggle, name='follow_toggle'),
-    path('profile/<str:username>/', views.profile, name='profile'),
+    path('profile/export/', hot.export_data, name='export_data'),
+    path('profile/follow/<int:pk>/', hot.follow_toggle, name='follow_toggle'),
+    path('profile/<str:username>/', hot.profile, name='profile'),
+    path('profile/<str:username>/followers/', views.followers, name='followers'),
+    path('profile/<str:username>/following/', views.following, name='following'),
     path('create/', views.tweet_create, name='tweet_create'),
-    path('<int:pk>/', views.tweet_detail, name='tweet_detail'),
+    path('<int:pk>/', hot.tweet_detail, name='tweet_detail'),
     path('<int:pk>/edit/', views.tweet_edit, name='tweet_edit'),
     path('<int:pk>/delete/', views.tweet_delete, name='tweet_delete'),
-    path('<int:pk>/like/', views.tweet_like, name='tweet_like'),
+    path('<int:pk>/like/', hot.tweet_like, name='tweet_like'),
     path('<int:pk>/comment/', views.tweet_comment, name='tweet_comment'),
+    path('notifications/', views.notification_list, name='notifications'),
+    path('notifications/mark-read/', views.notifications_mark_read, name='notifications_mark_read'),
+    path('live/', views.live_events, name='live'),
     path('register/', views.register, name='register'),
 ] 
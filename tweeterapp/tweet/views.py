@@ -1,105 +1,83 @@
 from django.shortcuts import redirect, render, get_object_or_404
-from .models import Tweet, Profile, Tag
+from .models import Tweet, Profile, Notification
 from .forms import TweetForm, UserRegistrationForm, CommentForm, UserUpdateForm, ProfileUpdateForm
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.core.paginator import Paginator
-from django.db.models import Count
-from django.utils.text import slugify
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_http_methods, require_POST
+from django.views.static import serve
+from django.conf import settings
+from . import archive, cards, conditional, graph, jobs, linkify, live, notifications, pages, perf, storage, tasks, timeline
+from .pagination import CursorPaginator, RankedPaginator
 
 def home(request):
     return render(request, 'index.html')
 
-def tweet_list(request):
-    tweets = Tweet.objects.all().order_by('-created_at')
-    query = request.GET.get('q')
-    if query:
-        # If searching for a hashtag (e.g. #django), filter by the tag name
-        if query.startswith('#'):
-            tag_slug = slugify(query[1:])
-            tweets = tweets.filter(tags__slug=tag_slug)
-        else:
-            tweets = tweets.filter(text__icontains=query)
-    
-    paginator = Paginator(tweets, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    who_to_follow = []
-    if request.user.is_authenticated:
-        # Get all profiles excluding the current user's profile
-        all_profiles = Profile.objects.exclude(user=request.user)
-        # Filter out profiles the user is already following
-        following_ids = request.user.profile.follows.values_list('id', flat=True)
-        who_to_follow = all_profiles.exclude(id__in=following_ids).order_by('?')[:3]
-
-    # Get trending tags (top 5 by number of tweets)
-    trending_tags = Tag.objects.annotate(num_tweets=Count('tweets')).order_by('-num_tweets')[:5]
+def feed_context(request, page_obj, extra_texts=()):
+    # Batched per-page lookups for the tweet cards: one query each
+    return pages.cards_context(page_obj, cards.liked_ids(request.user, page_obj),
+                               linkify.existing_mentions(pages.card_texts(page_obj, extra_texts)))
 
+@conditional.condition(conditional.feed_markers, expires=settings.TRENDING_CACHE_TIMEOUT,
+                       anonymous_max_age=settings.ANONYMOUS_FEED_MAX_AGE)
+def tweet_list(request):
+    page_obj = pages.feed_paginator(request.GET).get_page(request.GET.get('cursor'))
     return render(request, 'tweet_list.html', {
-        'tweets': page_obj, 
-        'who_to_follow': who_to_follow, 
-        'page_obj': page_obj,
-        'trending_tags': trending_tags
+        **feed_context(request, page_obj),
+        **pages.feed_sidebar(request.user, request.GET),
     })
 
+@login_required
+def home_timeline(request):
+    paginator = timeline.home_timeline(request.user.profile, 10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    return render(request, 'tweet_list.html', {**feed_context(request, page_obj), 'feed': 'following'})
+
+@conditional.condition(conditional.profile_markers)
 def profile(request, username):
-    profile_user = get_object_or_404(User, username=username)
-    
+    profile_user = get_object_or_404(User.objects.select_related('profile'), username=username)
     tab = request.GET.get('tab', 'tweets')
-    if tab == 'likes':
-        tweets = profile_user.liked_tweets.all().order_by('-created_at')
-    else:
-        tweets = Tweet.objects.filter(user=profile_user).order_by('-created_at')
-    
-    paginator = Paginator(tweets, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    # Check follow status
-    is_following = False
-    if request.user.is_authenticated:
-        if request.user.profile.follows.filter(id=profile_user.profile.id).exists():
-            is_following = True
-            
+    page_obj = pages.profile_paginator(profile_user, tab).get_page(request.GET.get('cursor'))
     return render(request, 'profile.html', {
-        'profile_user': profile_user, 
-        'tweets': page_obj,
+        # The bio shares the page's username lookup
+        **feed_context(request, page_obj, [profile_user.profile.bio]),
+        **pages.profile_relationship(request.user, profile_user),
+        'profile_user': profile_user,
+        'active_tab': tab,
+    })
+
+@conditional.condition(conditional.profile_markers)
+def followers(request, username):
+    return follow_list(request, username, 'followers')
+
+@conditional.condition(conditional.profile_markers)
+def following(request, username):
+    return follow_list(request, username, 'following')
+
+def follow_list(request, username, direction):
+    profile_user = get_object_or_404(User.objects.select_related('profile'), username=username)
+    ids = graph.followers(profile_user.profile.pk) if direction == 'followers' else graph.following(profile_user.profile.pk)
+    # Newest accounts first; each page loads only its own profiles
+    paginator = RankedPaginator(Profile.objects.select_related('user'), ids[::-1], 20)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    viewer_follows = graph.following(request.user.profile.pk) if request.user.is_authenticated else ()
+    for profile in page_obj:
+        profile.followed_by_viewer = graph.contains(viewer_follows, profile.pk)
+    return render(request, 'follow_list.html', {
+        'profile_user': profile_user,
         'page_obj': page_obj,
-        'is_following': is_following,
-        'active_tab': tab
+        'direction': direction,
+        'total': len(ids),
     })
 
 @login_required
+@require_http_methods(['GET', 'POST', 'PUT', 'DELETE'])
 def follow_toggle(request, pk):
-    profile_to_toggle = get_object_or_404(Profile, pk=pk)
-    if request.user.profile == profile_to_toggle:
-        messages.warning(request, "You cannot follow yourself.")
-        return redirect('profile', username=request.user.username)
-        
-    is_following = False
-    if request.user.profile.follows.filter(pk=profile_to_toggle.pk).exists():
-        request.user.profile.follows.remove(profile_to_toggle)
-        is_following = False
-        if not request.headers.get('x-requested-with') == 'XMLHttpRequest':
-            messages.info(request, f"You have unfollowed {profile_to_toggle.user.username}.")
-    else:
-        request.user.profile.follows.add(profile_to_toggle)
-        is_following = True
-        if not request.headers.get('x-requested-with') == 'XMLHttpRequest':
-            messages.success(request, f"You are now following {profile_to_toggle.user.username}.")
-            
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        return JsonResponse({
-            'is_following': is_following,
-            'followers_count': profile_to_toggle.followed_by.count(),
-            'following_count': profile_to_toggle.follows.count()
-        })
-        
-    return redirect('profile', username=profile_to_toggle.user.username)
+    profile_to_toggle = get_object_or_404(Profile.objects.select_related('user'), pk=pk)
+    return pages.toggle_follow(request, request.user, profile_to_toggle)
 
 @login_required
 def edit_profile(request):
@@ -121,35 +99,30 @@ def edit_profile(request):
     }
     return render(request, 'edit_profile.html', context)
 
+@login_required
+def export_data(request):
+    # Streamed as it's read: an account's archive can run to millions of lines
+    return pages.export_response(request.user, archive.lines)
+
 @login_required
 def my_tweets(request):
-    tweets = Tweet.objects.filter(user=request.user).order_by('-created_at')
-    paginator = Paginator(tweets, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return render(request, 'tweet_list.html', {'tweets': page_obj, 'page_obj': page_obj})
+    tweets = Tweet.objects.filter(user=request.user).for_display()
+    paginator = CursorPaginator(tweets, 10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    return render(request, 'tweet_list.html', feed_context(request, page_obj))
 
+@conditional.condition(conditional.tweet_markers)
 def tweet_detail(request, pk):
-    tweet = get_object_or_404(Tweet, pk=pk)
-    comments = tweet.comments.all().order_by('-created_at')
-    form = CommentForm()
-    return render(request, 'tweet_detail.html', {'tweet': tweet, 'comments': comments, 'form': form})
+    tweet = get_object_or_404(Tweet.objects.for_display(), pk=pk)
+    comments = tweet.comments.select_related('user__profile').order_by('-created_at')
+    return render(request, 'tweet_detail.html', pages.detail_context(
+        tweet, comments, cards.liked_ids(request.user, [tweet]), linkify.existing_mentions([tweet.text])))
 
 @login_required
+@require_http_methods(['GET', 'POST', 'PUT', 'DELETE'])
 def tweet_like(request, pk):
-    tweet = get_object_or_404(Tweet, pk=pk)
-    liked = False
-    if request.user in tweet.likes.all():
-        tweet.likes.remove(request.user)
-        liked = False
-    else:
-        tweet.likes.add(request.user)
-        liked = True
-        
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        return JsonResponse({'liked': liked, 'count': tweet.total_likes()})
-    
-    return redirect(request.META.get('HTTP_REFERER', 'tweet_list'))
+    tweet = get_object_or_404(Tweet.objects.only('id', 'user_id'), pk=pk)
+    return pages.toggle_like(request, request.user, tweet)
 
 @login_required
 def tweet_comment(request, pk):
@@ -161,6 +134,7 @@ def tweet_comment(request, pk):
             comment.user = request.user
             comment.tweet = tweet
             comment.save()
+            tasks.notify.enqueue(tweet.user_id, request.user.id, 'comment', tweet.pk)
             messages.success(request, 'Your reply has been posted.')
     return redirect('tweet_detail', pk=pk)
 
@@ -200,6 +174,44 @@ def tweet_delete(request, pk):
         return redirect('tweet_list')
     return render(request, 'tweet_confirm_delete.html', {'tweet': tweet})
 
+@login_required
+def notification_list(request):
+    user_notifications = Notification.objects.filter(recipient=request.user).select_related('sender', 'tweet')
+    paginator = CursorPaginator(user_notifications, 20, ordering=('-updated_at', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    return render(request, 'notifications.html', {'notifications': page_obj, 'page_obj': page_obj})
+
+@login_required
+@require_POST
+def notifications_mark_read(request):
+    # No ids means "mark everything read"
+    ids = [int(pk) for pk in request.POST.getlist('ids') if pk.isdigit()] or None
+    notifications.mark_read(request.user, ids)
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse({'unread_count': notifications.unread_count(request.user)})
+    return redirect('notifications')
+
+def live_events(request):
+    # Under WSGI: what's new since the browser's last event, then EventSource
+    # polls again. ASGI deployments serve this URL from tweet.live.stream.
+    response = HttpResponse(live.poll(request), content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+def metrics(request):
+    # Prometheus scrape target, summed across workers
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS):
+        raise Http404
+    return HttpResponse(perf.render_prometheus() + jobs.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def media(request, path):
+    # Local media in development. Blobs are named after their content, so
+    # browsers may keep them for good.
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if path.startswith(storage.BLOB_PREFIX):
+        patch_cache_control(response, public=True, max_age=storage.IMMUTABLE_MAX_AGE, immutable=True)
+    return response
+
 def register(request):
     if request.method == 'POST':
         form = UserRegistrationForm(request.POST, request.FILES)
@@ -12,5 +12,17 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tweeterapp.settings')
+# Route the hot read paths and like/follow endpoints to tweet.async_views
+os.environ.setdefault('ASYNC_VIEWS', 'true')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from tweet import live  # noqa: E402  (needs the app registry set up above)
+
+
+async def application(scope, receive, send):
+    # Live event streams are served beside Django rather than through it: its
+    # handler holds a thread per request for as long as a response streams
+    if scope['type'] == 'http' and scope['path'] == live.path():
+        return await live.stream(scope, receive, send)
+    return await django_application(scope, receive, send)
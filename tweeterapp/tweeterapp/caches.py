@@ -0,0 +1,32 @@
+# CACHES entries from a URL, as CACHE_URL gives one: redis://host:6379/0 (or
+# rediss://) for Redis or any server speaking its protocol, which needs the
+# redis package; file:///path/to/dir for a directory every process on one host
+# can reach, the stand-in for a shared cache in local multi-process runs; and
+# locmem:// or nothing for this process's memory.
+from urllib.parse import unquote, urlsplit
+
+from django.core.exceptions import ImproperlyConfigured
+
+BACKENDS = {
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'rediss': 'django.core.cache.backends.redis.RedisCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+}
+
+
+def config(url, timeout=300, max_entries=10000):
+    parts = urlsplit(url or 'locmem://')
+    backend = BACKENDS.get(parts.scheme)
+    if backend is None:
+        raise ImproperlyConfigured(f"Unsupported CACHE_URL scheme {parts.scheme!r}.")
+    cache = {'BACKEND': backend, 'TIMEOUT': timeout}
+    if parts.scheme == 'file':
+        cache['LOCATION'] = unquote(parts.path)
+        cache['OPTIONS'] = {'MAX_ENTRIES': max_entries}
+    elif parts.scheme == 'locmem':
+        cache['LOCATION'] = parts.netloc or 'default'
+        cache['OPTIONS'] = {'MAX_ENTRIES': max_entries}
+    else:
+        cache['LOCATION'] = url
+    return cache
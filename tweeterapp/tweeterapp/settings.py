@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 from pathlib import Path
 import os
 
+from . import caches, database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,8 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tweet.middleware.PerformanceMiddleware',  # First, so it times everything below
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # WhiteNoise for static files
+    'tweet.middleware.StaticFilesMiddleware',  # WhiteNoise for static files, async-capable
+    'tweet.middleware.ReplicaMiddleware',  # Before anything that reads, sessions included
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -57,6 +61,10 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'tweeterapp.urls'
 
+# Serve tweet.async_views for the hot read paths and the like/follow JSON
+# endpoints. tweeterapp/asgi.py turns this on; the WSGI app keeps the sync views.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False').lower() == 'true'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -67,6 +75,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'tweet.context_processors.unread_notifications',
             ],
         },
     },
@@ -78,13 +87,46 @@ WSGI_APPLICATION = 'tweeterapp.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Postgres when DATABASE_URL is set (render.yaml passes the managed
+# database's), otherwise a local SQLite file; see tweeterapp/database.py for
+# the URL format and SQLite tuning. Postgres connections come from Django's
+# pool, up to DATABASE_POOL_MAX_SIZE per process: under ASGI each request runs
+# its queries on a thread of its own, so a persistent connection would never
+# be reused. With DATABASE_POOL=false they persist for DATABASE_CONN_MAX_AGE
+# seconds instead, as SQLite's always do.
+DATABASE_POOL = os.environ.get('DATABASE_POOL', 'True').lower() == 'true'
+DATABASE_CONNECTIONS = {
+    'conn_max_age': int(os.environ.get('DATABASE_CONN_MAX_AGE', 600)),
+    'pool': {
+        'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 10)),
+        'timeout': 10,
+    } if DATABASE_POOL else None,
+}
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database.config(
+        os.environ.get('DATABASE_URL') or f"sqlite:///{BASE_DIR / 'db.sqlite3'}", **DATABASE_CONNECTIONS),
 }
 
+# Read replicas: comma-separated URLs in DATABASE_REPLICA_URLS, in the same
+# format, become 'replica1', 'replica2'... Requests read from them through
+# tweet.routers.ReplicaRouter; writes go to 'default', and so do the reads of a
+# visitor who wrote in the last DATABASE_REPLICA_PIN_SECONDS (the cookie
+# REPLICA_PIN_COOKIE), which should cover the replication lag. To try it
+# locally, copy db.sqlite3 and point DATABASE_REPLICA_URLS at the copy: it
+# won't see new rows, except through the pinned reads.
+DATABASE_REPLICAS = []
+for number, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        **database.config(url.strip(), **DATABASE_CONNECTIONS),
+        # Tests read what they wrote
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['tweet.routers.ReplicaRouter']
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DATABASE_REPLICA_PIN_SECONDS', 5))
+REPLICA_PIN_COOKIE = 'read_primary'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -124,14 +166,17 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-# Media files storage - use Cloudinary in production, local storage in development
+# Media files storage - use Cloudinary in production, local storage in development.
+# Either way uploads go through tweet.storage, which stores each distinct file
+# once under its content hash and reference counts it.
 CLOUDINARY_CLOUD_NAME = os.environ.get('CLOUDINARY_CLOUD_NAME', '')
 
 if CLOUDINARY_CLOUD_NAME:
     # Production: Use Cloudinary
     STORAGES = {
         "default": {
-            "BACKEND": "cloudinary_storage.storage.MediaCloudinaryStorage",
+            "BACKEND": "tweet.storage.ContentAddressedStorage",
+            "OPTIONS": {"backend": "cloudinary_storage.storage.MediaCloudinaryStorage"},
         },
         "staticfiles": {
             "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
@@ -146,7 +191,8 @@ else:
     # Development: Use local file storage
     STORAGES = {
         "default": {
-            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "BACKEND": "tweet.storage.ContentAddressedStorage",
+            "OPTIONS": {"backend": "django.core.files.storage.FileSystemStorage"},
         },
         "staticfiles": {
             "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
@@ -156,6 +202,33 @@ else:
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Caches. 'default' holds rendered cards, trending tags, sessions and the
+# per-user memos in tweet.memo; CACHE_URL points it at a cache every web
+# process and job worker can reach (see tweeterapp/caches.py), otherwise it's
+# this process's memory. 'local' is always this process's memory, a first tier
+# in front of 'default' for the memos.
+CACHE_URL = os.environ.get('CACHE_URL', '')
+CACHES = {
+    'default': caches.config(CACHE_URL),
+    'local': caches.config('locmem://local', timeout=60),
+}
+# Whether every process sees the same 'default'. Sessions and the user memos
+# are only cached across requests if so: a copy in one process's memory would
+# outlive a logout or profile edit handled by another.
+CACHE_SHARED = os.environ.get('CACHE_SHARED', str(bool(CACHE_URL))).lower() == 'true'
+MEMO_TIMEOUT = 60 * 60
+MEMO_LOCAL_TIMEOUT = 60
+
+# How long a reverse proxy or browser may reuse the public feed as rendered
+# for anonymous visitors. Every other page is revalidated with its ETag.
+ANONYMOUS_FEED_MAX_AGE = int(os.environ.get('ANONYMOUS_FEED_MAX_AGE', 10))
+
+SESSION_ENGINE = (
+    'django.contrib.sessions.backends.cached_db' if CACHE_SHARED
+    else 'django.contrib.sessions.backends.db'
+)
+AUTHENTICATION_BACKENDS = ['tweet.auth.CachedModelBackend']
+
 LOGIN_URL = "/accounts/login/"
 LOGIN_REDIRECT_URL = "/tweet/"
 LOGOUT_REDIRECT_URL = "/tweet/"
@@ -167,3 +240,112 @@ CSRF_TRUSTED_ORIGINS = [
 ]
 
 
+# Home timeline: tweets are fanned out to followers on write unless the author
+# has more followers than TIMELINE_FANOUT_LIMIT, in which case they are merged
+# in at read time. Inboxes keep their TIMELINE_SIZE newest entries, cut back
+# by `manage.py trim_timelines` (run it periodically); older tweets are read
+# from the follow graph.
+TIMELINE_FANOUT_LIMIT = int(os.environ.get('TIMELINE_FANOUT_LIMIT', 5000))
+TIMELINE_BACKFILL_SIZE = 200
+TIMELINE_SIZE = 800
+
+# Full-text search. None picks SQLite FTS5 or Postgres tsvector by database
+# vendor; set a dotted path to a tweet.search backend class to override.
+SEARCH_BACKEND = None
+SEARCH_MAX_RESULTS = 1000
+
+# Trending tags: hourly usage buckets scored with exponential decay over the
+# selected window. The top-K list is cached for TRENDING_CACHE_TIMEOUT seconds.
+TRENDING_WINDOWS = {'1h': 1, '24h': 24, '7d': 24 * 7}
+TRENDING_DEFAULT_WINDOW = '24h'
+TRENDING_TOP_K = 10
+TRENDING_CACHE_TIMEOUT = 60
+
+# Who to follow: candidates stored per profile and refreshed on follow changes
+# or by the refresh_suggestions command. A profile without any has them queued
+# at most once per SUGGESTIONS_QUEUED_TIMEOUT seconds and sees popular accounts.
+SUGGESTIONS_PER_PROFILE = 20
+SUGGESTIONS_POPULAR_POOL = 50
+SUGGESTIONS_QUEUED_TIMEOUT = 300
+
+# Rendered tweet HTML memoized per distinct text
+LINKIFY_CACHE_SIZE = 4096
+
+# Rendered tweet cards; keys are versioned on everything a card shows, so the
+# timeout only bounds how long superseded versions linger
+TWEET_CARD_CACHE_TIMEOUT = 60 * 60
+
+# Request instrumentation (tweet.middleware.PerformanceMiddleware). A fraction
+# PERF_SAMPLE_RATE of requests is timed. With PERF_METRICS_DIR set, every
+# worker flushes its histograms there and /metrics sums them.
+PERF_SAMPLE_RATE = float(os.environ.get('PERF_SAMPLE_RATE', 1.0))
+PERF_SERVER_TIMING = os.environ.get('PERF_SERVER_TIMING', str(DEBUG)).lower() == 'true'
+PERF_METRICS_DIR = os.environ.get('PERF_METRICS_DIR', '')
+PERF_FLUSH_INTERVAL = 5
+PERF_METRICS_PREFIX = 'tweeter'
+# /metrics is served to staff users and to scrapers from these addresses
+INTERNAL_IPS = os.environ.get('INTERNAL_IPS', '127.0.0.1').split(',')
+
+# Uploaded images: metadata is stripped and resized copies are written next to
+# the original in STORAGES['default'] by a background job. Formats this Pillow
+# build can't encode are skipped.
+IMAGE_RENDITION_WIDTHS = {
+    'tweet': [320, 640, 1280],
+    'avatar': [64, 128, 256],
+}
+IMAGE_RENDITION_FORMATS = ['avif', 'webp']
+IMAGE_RENDITION_QUALITY = 80
+IMAGE_ORIGINAL_QUALITY = 90
+
+# Background jobs (tweet.jobs): the side effects of writes are queued in the
+# database and run by `manage.py run_workers`. With JOBS_ALWAYS_EAGER they run
+# inline instead, as in development and tests. A failed job is retried after
+# JOBS_RETRY_BACKOFF seconds, doubling per attempt up to JOBS_RETRY_BACKOFF_MAX;
+# a running job untouched for JOBS_LEASE_TIMEOUT is assumed lost and rerun.
+JOBS_ALWAYS_EAGER = os.environ.get('JOBS_ALWAYS_EAGER', str(DEBUG)).lower() == 'true'
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_BACKOFF = 2
+JOBS_RETRY_BACKOFF_MAX = 10 * 60
+JOBS_LEASE_TIMEOUT = 5 * 60
+JOBS_BATCH_SIZE = 10
+JOBS_POLL_INTERVAL = 1.0
+
+# Live updates (tweet.live): new-tweet notices, like counts and notification
+# badges pushed to pages over Server-Sent Events. Under ASGI each web process
+# holds its streams open and polls LIVE_BACKEND for new events every
+# LIVE_POLL_INTERVAL seconds; under WSGI the endpoint returns what's new and
+# the browser asks again after LIVE_POLL_RETRY. A stream more than
+# LIVE_QUEUE_SIZE events behind is reset rather than buffered. Set
+# LIVE_BACKEND to tweet.live.LocalBackend for a single process with eager jobs.
+LIVE_BACKEND = os.environ.get('LIVE_BACKEND', 'tweet.live.DatabaseBackend')
+LIVE_POLL_INTERVAL = 1.0
+LIVE_HEARTBEAT = 15
+LIVE_RETRY = 3
+LIVE_POLL_RETRY = 15
+LIVE_QUEUE_SIZE = 100
+LIVE_REPLAY_LIMIT = 1000
+LIVE_RETENTION = 5 * 60
+LIVE_MAX_STREAMS = int(os.environ.get('LIVE_MAX_STREAMS', 10000))
+LIVE_MAX_TWEETS = 100
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # One JSON line per sampled request; set PERF_LOG_LEVEL=INFO to emit
+        'tweet.perf': {
+            'handlers': ['console'],
+            'level': os.environ.get('PERF_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+        # Job retries and failures from run_workers
+        'tweet.jobs': {
+            'handlers': ['console'],
+            'level': os.environ.get('JOBS_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
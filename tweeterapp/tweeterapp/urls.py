@@ -15,9 +15,8 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 from django.urls import include
 from django.contrib.auth import views as auth_views
 from tweet import views
@@ -26,8 +25,12 @@ from tweet import views
 urlpatterns = [
     path('', views.home, name='home'),  # Root URL - homepage
     path('admin/', admin.site.urls),
+    path('metrics', views.metrics, name='metrics'),
     path('tweet/', include('tweet.urls')),
     path('accounts/', include('django.contrib.auth.urls')),
     
     
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.DEBUG:
+    urlpatterns.append(re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), views.media, name='media'))